@@ -1,13 +1,28 @@
 import duckdb
-import pandas as pd
+import gzip
 import json
+import math
 import os
+import sys
 
-DB_FILE = "mydatabase.duckdb"
+from nearest_paths import PathIndex, METRIC_GEOM_COL, column_type, nearest_path_distances
+from path_segments import TABLE_SEGMENTS
+from stations_ingest import DIM_TABLE, data_snapshot_date, load_new_snapshots_to_duckdb
+from processed_store import ANALYSIS_DATASET, write_analysis_output
+from pipeline_metrics import stage_metrics
+from utils import DB_PATH
+
+DB_FILE = str(DB_PATH)
 TABLE_PATHS = "bike_paths_clean"
-TABLE_STATIONS = "stations_static"
+TABLE_STATIONS = DIM_TABLE
 OUTPUT_GEOJSON = "processed/analysis_output.geojson"
-OUTPUT_CSV = "processed/analysis_output.csv"
+TABLE_DISTANCES = "station_path_distance"
+TABLE_DISTANCES_META = "station_path_distance_meta"
+GEOJSON_BATCH_ROWS = 10000
+
+# "--ndjson": GeoJSONSeq (jedna cecha na linię), "--gzip": kompresja pliku wynikowego
+NEWLINE_DELIMITED = "--ndjson" in sys.argv
+GZIP_OUTPUT = "--gzip" in sys.argv
 
 
 STATIONS_FOLDER = os.path.join(
@@ -18,39 +33,112 @@ STATIONS_FOLDER = os.path.join(
 
 
 def load_stations_to_duckdb(con):
-    """Wczytuje maksymalnie 100 plików JSON z folderu i tworzy tabelę stations_static w DuckDB"""
-    if not os.path.exists(STATIONS_FOLDER):
-        raise FileNotFoundError(f"Nie znaleziono folderu stacji: {STATIONS_FOLDER}")
-
-
-    json_files = sorted(
-        [f for f in os.listdir(STATIONS_FOLDER) if f.lower().endswith(".json")]
-    )[:100]
-
-    if not json_files:
-        raise FileNotFoundError(f"Nie znaleziono żadnego pliku JSON w folderze: {STATIONS_FOLDER}")
-
-    print(f"[INFO] Wczytywane pliki JSON: {len(json_files)} (limit = 100)")
-
-    all_stations = []
-
-    for file_name in json_files:
-        path = os.path.join(STATIONS_FOLDER, file_name)
-        print(f"[INFO] Wczytywany plik stacji: {path}")
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        for s in data.get("stations_data", []):
-            all_stations.append({
-                "station_id": s["uid"],
-                "name": s.get("name", ""),
-                "lat": s["geoCoords"]["lat"],
-                "lon": s["geoCoords"]["lng"]
-            })
-
-    df_stations = pd.DataFrame(all_stations)
-    con.execute(f"CREATE OR REPLACE TABLE {TABLE_STATIONS} AS SELECT * FROM df_stations")
-    print(f"[INFO] Tabela {TABLE_STATIONS} utworzona w DuckDB")
+    """Dopisuje do wymiaru stacji i tabeli faktów w DuckDB nowe lub zmienione pliki JSON z folderu"""
+    added = load_new_snapshots_to_duckdb(con, STATIONS_FOLDER, dim_table=TABLE_STATIONS)
+    print(f"[INFO] Tabela {TABLE_STATIONS} zaktualizowana w DuckDB (+{added} pomiarów)")
+
+
+def input_cache_key(con):
+    """Klucz cache z liczby wierszy i sum kontrolnych tabel wejściowych"""
+    parts = []
+    inputs = [(TABLE_STATIONS, "station_id, name, lon, lat, valid_from"), (TABLE_PATHS, "id, geom")]
+    if column_type(con, TABLE_SEGMENTS, "geom"):
+        inputs.append((TABLE_SEGMENTS, "path_id, geom"))
+    for table, cols in inputs:
+        n, checksum = con.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(hash({cols})::HUGEINT), 0) FROM (SELECT DISTINCT {cols} FROM {table})"
+        ).fetchone()
+        parts.append(f"{table}:{n}:{checksum}")
+    return "|".join(parts)
+
+
+def cached_cache_key(con):
+    tables = con.execute("SELECT table_name FROM information_schema.tables").fetchdf()["table_name"].tolist()
+    if TABLE_DISTANCES not in tables or TABLE_DISTANCES_META not in tables:
+        return None
+    row = con.execute(f"SELECT cache_key FROM {TABLE_DISTANCES_META}").fetchone()
+    return row[0] if row else None
+
+
+def compute_station_distances(con):
+    """Liczy odległość każdej lokalizacji stacji od najbliższej ścieżki przez indeks STRtree
+    i zapisuje wynik w tabeli station_path_distance (pomija obliczenia, gdy wejście się nie zmieniło)"""
+    cache_key = input_cache_key(con)
+    if cached_cache_key(con) == cache_key:
+        print(f"[INFO] Dane wejściowe bez zmian — używam zapisanej tabeli {TABLE_DISTANCES}")
+        return
+
+    stations = con.execute(
+        f"SELECT station_id, name, lon, lat FROM {TABLE_STATIONS} WHERE valid_to IS NULL ORDER BY station_id"
+    ).fetchdf()
+
+    if column_type(con, TABLE_PATHS, METRIC_GEOM_COL):
+        # kopia metryczna i bbox z preprocess.py: kandydaci wybierani po kolumnach bbox, odległość w metrach;
+        # krótkie odcinki z path_segments.py (jeśli zbudowane) zamiast całych ścieżek
+        table, id_col = (TABLE_SEGMENTS, "path_id") if column_type(con, TABLE_SEGMENTS, METRIC_GEOM_COL) else (TABLE_PATHS, "id")
+        stations["min_distance_m"] = nearest_path_distances(con, table, stations["lon"], stations["lat"], id_col=id_col)
+        if stations["min_distance_m"].isna().all():
+            print("[WARN] Brak geometrii ścieżek — wynik będzie pusty.")
+            stations = stations.iloc[0:0]
+    else:
+        index = PathIndex.from_duckdb(con, TABLE_PATHS)
+        print(f"[INFO] Zaindeksowane ścieżki: {len(index)}")
+        if len(index) == 0:
+            print("[WARN] Brak geometrii ścieżek — wynik będzie pusty.")
+            stations = stations.iloc[0:0]
+
+        _, dist = index.nearest(stations["lon"], stations["lat"], k=1)
+        stations["min_distance_m"] = dist[:, 0]
+
+    con.execute(f"CREATE OR REPLACE TABLE {TABLE_DISTANCES} AS SELECT * FROM stations")
+    con.execute(f"CREATE OR REPLACE TABLE {TABLE_DISTANCES_META} (cache_key VARCHAR)")
+    con.execute(f"INSERT INTO {TABLE_DISTANCES_META} VALUES (?)", [cache_key])
+    print(f"[INFO] Tabela {TABLE_DISTANCES} zapisana w DuckDB")
+
+
+def write_geojson(con, query, path, newline_delimited=False):
+    """Strumieniowo zapisuje wynik zapytania jako GeoJSON FeatureCollection (lub GeoJSONSeq, jedna cecha na linię).
+
+    Zapytanie musi zwracać kolumnę geometry z tekstem GeoJSON; pozostałe kolumny trafiają do properties.
+    Wyniki są pobierane paczkami z DuckDB, a plik kończący się na .gz jest kompresowany gzipem.
+    Zwraca liczbę zapisanych obiektów.
+    """
+    result = con.execute(query)
+    if hasattr(result, "to_arrow_reader"):
+        reader = result.to_arrow_reader(GEOJSON_BATCH_ROWS)
+    else:
+        reader = result.fetch_record_batch(GEOJSON_BATCH_ROWS)
+
+    if path.endswith(".gz"):
+        f = gzip.open(path, "wt", encoding="utf-8")
+    else:
+        f = open(path, "w", encoding="utf-8", buffering=1 << 20)
+
+    n = 0
+    with f:
+        if not newline_delimited:
+            f.write('{"type":"FeatureCollection","features":[\n')
+        for batch in reader:
+            columns = batch.to_pydict()
+            geometries = columns.pop("geometry")
+            names = list(columns)
+            for i, geometry in enumerate(geometries):
+                properties = {}
+                for name in names:
+                    value = columns[name][i]
+                    properties[name] = None if isinstance(value, float) and math.isnan(value) else value
+                feature = (
+                    f'{{"type":"Feature","geometry":{geometry or "null"},'
+                    f'"properties":{json.dumps(properties, ensure_ascii=False)}}}'
+                )
+                if newline_delimited:
+                    f.write(feature + "\n")
+                else:
+                    f.write((",\n" if n else "") + feature)
+                n += 1
+        if not newline_delimited:
+            f.write("\n]}\n")
+    return n
 
 
 def main():
@@ -61,99 +149,52 @@ def main():
     con.execute("INSTALL spatial;")
     con.execute("LOAD spatial;")
 
-    print("[INFO] Wczytywanie stacji z JSON do DuckDB...")
-    load_stations_to_duckdb(con)
+    with stage_metrics("analysis", con) as m:
+        print("[INFO] Wczytywanie stacji z JSON do DuckDB...")
+        with m.step("load_stations"):
+            load_stations_to_duckdb(con)
 
-    print("[INFO] Tworzenie geometrii stacji i ścieżek rowerowych...")
-    geom_paths = "ST_GeomFromText(geom)"
-    geom_stations = "ST_Point(lon, lat)"
+        print("[INFO] Liczenie odległości stacji od najbliższej ścieżki rowerowej...")
+        with m.step("station_distances"):
+            compute_station_distances(con)
 
-    print("[INFO] Liczenie odległości stacji od najbliższej ścieżki rowerowej...")
-    query = f"""
-    WITH stations AS (
+        query = f"""
         SELECT
             station_id,
             name,
-            {geom_stations} AS geom
-        FROM {TABLE_STATIONS}
-    ),
-    paths AS (
-        SELECT
-            id AS path_id,
-            {geom_paths} AS geom
-        FROM {TABLE_PATHS}
-    ),
-    distances AS (
-        SELECT
-            s.station_id,
-            s.name,
-            MIN(ST_Distance(s.geom, p.geom)) AS min_distance_m
-        FROM stations s
-        JOIN paths p
-        ON TRUE
-        GROUP BY s.station_id, s.name
-    )
-    SELECT *
-    FROM distances
-    ORDER BY min_distance_m;
-    """
-
-    df = con.execute(query).fetchdf()
-    print("[INFO] Przykładowe wyniki:")
-    print(df.head())
-
-    os.makedirs("processed", exist_ok=True)
-    df.to_csv(OUTPUT_CSV, index=False)
-    print(f"[OK] Wynik zapisany do: {OUTPUT_CSV}")
-
-    print("[INFO] Generowanie GeoJSON z lokalizacjami stacji...")
-    geo_query = f"""
-    WITH stations AS (
+            arg_min(lat, min_distance_m) AS lat,
+            arg_min(lon, min_distance_m) AS lon,
+            MIN(min_distance_m) AS min_distance_m
+        FROM {TABLE_DISTANCES}
+        GROUP BY station_id, name
+        ORDER BY min_distance_m;
+        """
+
+        df = m.fetchdf(query, label="analysis_output")
+        m.rows_in = con.execute(f"SELECT COUNT(*) FROM {TABLE_DISTANCES}").fetchone()[0]
+        m.rows_out = len(df)
+        print("[INFO] Przykładowe wyniki:")
+        print(df.head())
+
+        os.makedirs("processed", exist_ok=True)
+        with m.step("write_analysis_output"):
+            snapshot_date = write_analysis_output(df, snapshot_date=data_snapshot_date(con))
+        print(f"[OK] Wynik zapisany do: {ANALYSIS_DATASET} (partycja {snapshot_date})")
+
+        print("[INFO] Generowanie GeoJSON z lokalizacjami stacji...")
+        geo_query = f"""
         SELECT
             station_id,
             name,
-            {geom_stations} AS geom
-        FROM {TABLE_STATIONS}
-    ),
-    distances AS (
-        SELECT
-            s.station_id,
-            s.name,
-            s.geom,
-            MIN(ST_Distance(s.geom, p.geom)) AS min_distance_m
-        FROM stations s
-        JOIN (
-            SELECT {geom_paths} AS geom FROM {TABLE_PATHS}
-        ) p
-        ON TRUE
-        GROUP BY s.station_id, s.name, s.geom
-    )
-    SELECT
-        station_id,
-        name,
-        min_distance_m,
-        ST_AsGeoJSON(geom) AS geometry
-    FROM distances;
-    """
-
-    gdf = con.execute(geo_query).fetchdf()
-
-    with open(OUTPUT_GEOJSON, "w", encoding="utf-8") as f:
-        f.write(
-            '{"type":"FeatureCollection","features":[' +
-            ",".join([
-                (
-                    f'{{"type":"Feature","geometry":{row.geometry},'
-                    f'"properties":{{"station_id":"{row.station_id}",'
-                    f'"name":"{row.name}",'
-                    f'"min_distance_m":{row.min_distance_m}}}}}'
-                )
-                for _, row in gdf.iterrows()
-            ]) +
-            "]}"
-        )
-
-    print(f"[OK] GeoJSON zapisany do: {OUTPUT_GEOJSON}")
+            min_distance_m,
+            ST_AsGeoJSON(ST_Point(lon, lat)) AS geometry
+        FROM {TABLE_DISTANCES};
+        """
+
+        output_geojson = OUTPUT_GEOJSON + ("l" if NEWLINE_DELIMITED else "") + (".gz" if GZIP_OUTPUT else "")
+        with m.step("write_geojson"):
+            n = write_geojson(con, geo_query, output_geojson, newline_delimited=NEWLINE_DELIMITED)
+        print(f"[OK] GeoJSON ({n} obiektów) zapisany do: {output_geojson}")
     print("[DONE] Analiza zakończona pomyślnie.")
 
 
@@ -1,32 +1,50 @@
-import pandas as pd
-import numpy as np
-import streamlit as st
+import time
+import datetime
+
+import duckdb
 import folium
-from folium.plugins import MarkerCluster, HeatMap
+import streamlit as st
 from streamlit_folium import st_folium
 
+from processed_store import latest_snapshot_date
+from dashboard_maps import map_center, build_heat_map, build_cluster_map, build_frame_map
+from dashboard_data import read_only_connection, data_version, query_stations, query_top_distances, query_overview
+from station_tiles import build_tiles, read_view, view_bounds
+from station_cube import build_cube, StationCube
+from utils import DB_PATH
+
+PLAYBACK_INTERVAL_S = 0.5
+
+# wyniki zapytań są cache'owane per wersja danych – nowa partycja lub zmiana bazy je unieważnia;
+# połączenie tylko do odczytu otwierane jest na czas zapytań i od razu zamykane
+@st.cache_data
+def load_overview(version, snapshot_date):
+    with read_only_connection(DB_PATH) as con:
+        return query_overview(con, snapshot_date)
+
+
+@st.cache_data
+def load_stations(version, snapshot_date, min_bikes):
+    with read_only_connection(DB_PATH) as con:
+        return query_stations(con, snapshot_date, min_bikes)
 
-CSV_FILE = "processed/analysis_output.csv"
 
 @st.cache_data
-def load_data(csv_path=CSV_FILE):
-    df = pd.read_csv(csv_path)
+def load_top(version, snapshot_date, min_bikes, top_n):
+    with read_only_connection(DB_PATH) as con:
+        return query_top_distances(con, snapshot_date, min_bikes, top_n)
 
-   
-    for col in ["lat", "lon", "availableBikes", "min_distance_m"]:
-        if col not in df.columns:
-            df[col] = np.nan
 
-    df = df.dropna(subset=["lat", "lon"])
-    df["lat"] = df["lat"].astype(float)
-    df["lon"] = df["lon"].astype(float)
-    if "availableBikes" in df.columns:
-        df["availableBikes"] = df["availableBikes"].fillna(0).astype(int)
-    if "min_distance_m" in df.columns:
-        df["min_distance_m"] = df["min_distance_m"].astype(float)
-    return df
+@st.cache_resource(max_entries=32)
+def load_maps(version, snapshot_date, min_bikes):
+    """Obie mapy dla danej wartości filtra – przy powrocie do tej wartości nie są budowane od nowa"""
+    df_filtered = load_stations(version, snapshot_date, min_bikes)
+    center = map_center(df_filtered)
+    return build_heat_map(df_filtered, center), build_cluster_map(df_filtered, center)
 
-df = load_data()
+snapshot_date = latest_snapshot_date()
+version = data_version(DB_PATH, snapshot_date)
+max_bikes, center = load_overview(version, snapshot_date)
 
 st.title("Dashboard stacji rowerowych")
 st.sidebar.header("Filtry")
@@ -34,39 +52,107 @@ st.sidebar.header("Filtry")
 
 min_bikes = st.sidebar.slider(
     "Minimalna liczba dostępnych rowerów",
-    0, int(df["availableBikes"].max() if "availableBikes" in df.columns else 0), 0
+    0, max_bikes, 0
 )
-df_filtered = df[df["availableBikes"] >= min_bikes]
+df_filtered = load_stations(version, snapshot_date, min_bikes)
+
+m, m2 = load_maps(version, snapshot_date, min_bikes)
 
 st.subheader("Heatmapa dostępnych rowerów")
-map_center = [df_filtered["lat"].mean(), df_filtered["lon"].mean()] if not df_filtered.empty else [52.0, 21.0]
-m = folium.Map(location=map_center, zoom_start=12)
-heat_data = [[row["lat"], row["lon"], row["availableBikes"]] for idx, row in df_filtered.iterrows()]
-if heat_data:
-    HeatMap(heat_data).add_to(m)
 st_folium(m, width=700, height=500)
 
 st.subheader("Stacje z markerami i klastrami")
-m2 = folium.Map(location=map_center, zoom_start=12)
-marker_cluster = MarkerCluster().add_to(m2)
-
-for idx, row in df_filtered.iterrows():
-    popup_text = f"Stacja: {row.get('name','-')}<br>Rowery: {row.get('availableBikes','-')}<br>Odległość od ścieżki: {row.get('min_distance_m','-'):.2f} m"
-    folium.Marker([row["lat"], row["lon"]], popup=popup_text).add_to(marker_cluster)
-
 st_folium(m2, width=700, height=500)
 
 
 st.subheader("Top N stacji najdalej od ścieżek")
 top_n = st.sidebar.number_input("Ilość stacji do wyświetlenia", min_value=1, max_value=50, value=10, step=1)
-if "min_distance_m" in df_filtered.columns:
-    df_top = df_filtered.sort_values("min_distance_m", ascending=False).head(top_n)
-    st.dataframe(df_top[["station_id", "name", "min_distance_m", "availableBikes"]])
+if df_filtered["min_distance_m"].notna().any():
+    st.dataframe(load_top(version, snapshot_date, min_bikes, top_n))
 else:
     st.info("Kolumna 'min_distance_m' nie istnieje. Uruchom najpierw analysis.py aby ją wygenerować.")
 
 st.subheader("Histogram odległości od najbliższej ścieżki")
-if "min_distance_m" in df_filtered.columns:
+if df_filtered["min_distance_m"].notna().any():
     st.bar_chart(df_filtered["min_distance_m"])
 else:
     st.info("Brak kolumny 'min_distance_m' – histogram nie może zostać wyświetlony.")
+
+
+st.subheader("Historia dostępności – agregaty kafelkowe")
+
+@st.cache_resource(ttl=600)
+def ensure_tiles():
+    """Buduje (lub potwierdza aktualność) cache kafelków na dysku; sprawdzane co 10 minut"""
+    with read_only_connection(DB_PATH) as con:
+        build_tiles(con)
+
+try:
+    ensure_tiles()
+except (duckdb.Error, FileNotFoundError):
+    st.info("Brak tabeli stations_hourly_summary. Uruchom najpierw preprocess.py.")
+else:
+    south, west, north, east, zoom = view_bounds(st.session_state.get("tiles_map"), center)
+    tiles = read_view(south, west, north, east, zoom)
+
+    layer = folium.FeatureGroup(name="Agregaty historyczne")
+    if tiles["features"]:
+        folium.GeoJson(
+            tiles,
+            marker=folium.CircleMarker(radius=8, fill=True, fill_opacity=0.6),
+            tooltip=folium.GeoJsonTooltip(fields=["stations", "avg_bikes"], aliases=["Stacje", "Średnio rowerów"]),
+        ).add_to(layer)
+
+    st_folium(
+        folium.Map(location=center, zoom_start=12),
+        feature_group_to_add=layer,
+        returned_objects=["bounds", "zoom"],
+        key="tiles_map",
+        width=700,
+        height=500,
+    )
+
+
+st.subheader("Odtwarzanie historii dostępności")
+
+@st.cache_resource(ttl=600)
+def load_cube():
+    """Buduje kostkę godzina × stacja, jeśli dane się zmieniły, i otwiera ją przez mmap"""
+    with read_only_connection(DB_PATH) as con:
+        build_cube(con)
+    return StationCube()
+
+try:
+    cube = load_cube()
+except (duckdb.Error, FileNotFoundError):
+    st.info("Brak tabeli stations_hourly_summary. Uruchom najpierw preprocess.py.")
+else:
+    if cube.n_hours < 2:
+        st.info("Za mało danych godzinowych do odtworzenia historii.")
+    else:
+        first_hour = cube.hour_at(0).replace(tzinfo=None)
+        last_hour = cube.hour_at(cube.n_hours - 1).replace(tzinfo=None)
+        step = datetime.timedelta(hours=1)
+
+        # stan suwaka ustawiany przed jego utworzeniem – w trybie odtwarzania przesuwany o klatkę
+        hour = st.session_state.get("playback_hour", first_hour)
+        playing = st.sidebar.checkbox("Odtwarzaj historię", key="playback_playing")
+        if playing:
+            hour = hour + step if hour < last_hour else first_hour
+        st.session_state["playback_hour"] = min(max(hour, first_hour), last_hour)
+
+        hour = st.slider(
+            "Godzina (UTC)",
+            min_value=first_hour,
+            max_value=last_hour,
+            step=step,
+            format="YYYY-MM-DD HH:mm",
+            key="playback_hour",
+        )
+        frame = cube.frame(cube.index_of(hour))
+        st_folium(build_frame_map(frame, center), width=700, height=500, key="playback_map")
+        st.caption(f"Stacje z pomiarem w tej godzinie: {len(frame)}")
+
+        if playing:
+            time.sleep(PLAYBACK_INTERVAL_S)
+            st.rerun()
@@ -0,0 +1,100 @@
+import os
+from contextlib import contextmanager
+
+import duckdb
+
+from dashboard_maps import DEFAULT_CENTER
+from processed_store import ANALYSIS_DATASET, PARTITION_COLUMN, latest_snapshot_date
+
+DASHBOARD_COLUMNS = ["station_id", "name", "lat", "lon", "availableBikes", "min_distance_m"]
+
+
+def connect_read_only(db_path):
+    """Połączenie tylko do odczytu z bazą pipeline'u (lub w pamięci, gdy pliku bazy jeszcze nie ma).
+
+    Wynik analizy jest czytany bezpośrednio z Parquet przez to samo połączenie.
+    """
+    if os.path.exists(db_path):
+        return duckdb.connect(str(db_path), read_only=True)
+    return duckdb.connect()
+
+
+@contextmanager
+def read_only_connection(db_path):
+    """with read_only_connection(DB_PATH) as con: ... – połączenie na jedną porcję zapytań.
+
+    Uchwyt jest zamykany zaraz po zapytaniach, więc nie blokuje otwarcia bazy do zapisu przez pipeline,
+    a połączenie w pamięci (przed utworzeniem bazy) nie zostaje w cache na stałe.
+    """
+    con = connect_read_only(db_path)
+    try:
+        yield con
+    finally:
+        con.close()
+
+
+def partition_path(snapshot_date):
+    return os.path.join(ANALYSIS_DATASET, f"{PARTITION_COLUMN}={snapshot_date}", "*.parquet")
+
+
+def data_version(db_path, snapshot_date=None):
+    """Znacznik wersji danych: najnowsza partycja wyniku i czasy modyfikacji jej plików oraz bazy"""
+    if snapshot_date is None:
+        snapshot_date = latest_snapshot_date()
+    partition_dir = os.path.dirname(partition_path(snapshot_date))
+    mtimes = [os.stat(os.path.join(partition_dir, f)).st_mtime for f in sorted(os.listdir(partition_dir))]
+    db_mtime = os.stat(db_path).st_mtime if os.path.exists(db_path) else None
+    return f"{snapshot_date}|{max(mtimes, default=0)}|{db_mtime}"
+
+
+def stations_source(cur, snapshot_date, distinct_stations=False):
+    """Podzapytanie z kolumnami DASHBOARD_COLUMNS (brakujące jako NULL) dla danej partycji"""
+    path = partition_path(snapshot_date)
+    available = {row[0] for row in cur.execute(f"DESCRIBE SELECT * FROM read_parquet('{path}')").fetchall()}
+    columns = ", ".join(
+        f'"{c}"' if c in available else f'NULL AS "{c}"' for c in DASHBOARD_COLUMNS
+    )
+    distinct = "DISTINCT ON (station_id) " if distinct_stations else ""
+    return f"""
+    SELECT {distinct}{columns}
+    FROM read_parquet('{path}')
+    WHERE lat IS NOT NULL AND lon IS NOT NULL
+    """ if "lat" in available and "lon" in available else f"SELECT {columns} WHERE false"
+
+
+def query_stations(cur, snapshot_date, min_bikes=0, distinct_stations=False):
+    """Stacje z co najmniej min_bikes rowerami – filtr liczony w DuckDB"""
+    source = stations_source(cur, snapshot_date, distinct_stations)
+    return cur.execute(f"""
+    SELECT
+        station_id,
+        name,
+        lat::DOUBLE AS lat,
+        lon::DOUBLE AS lon,
+        COALESCE(availableBikes, 0)::INTEGER AS availableBikes,
+        min_distance_m::DOUBLE AS min_distance_m
+    FROM ({source})
+    WHERE COALESCE(availableBikes, 0) >= ?
+    """, [min_bikes]).fetchdf()
+
+
+def query_top_distances(cur, snapshot_date, min_bikes=0, top_n=10, distinct_stations=False):
+    """Top N stacji najdalej od ścieżek – sortowanie i LIMIT w DuckDB"""
+    source = stations_source(cur, snapshot_date, distinct_stations)
+    return cur.execute(f"""
+    SELECT station_id, name, min_distance_m::DOUBLE AS min_distance_m, COALESCE(availableBikes, 0)::INTEGER AS availableBikes
+    FROM ({source})
+    WHERE COALESCE(availableBikes, 0) >= ?
+    ORDER BY min_distance_m DESC NULLS LAST
+    LIMIT ?
+    """, [min_bikes, int(top_n)]).fetchdf()
+
+
+def query_overview(cur, snapshot_date, distinct_stations=False):
+    """Maksymalna liczba rowerów i środek mapy dla całej partycji w jednym przebiegu"""
+    source = stations_source(cur, snapshot_date, distinct_stations)
+    max_bikes, lat, lon = cur.execute(
+        f"SELECT COALESCE(MAX(availableBikes), 0), AVG(lat), AVG(lon) FROM ({source})"
+    ).fetchone()
+    center = DEFAULT_CENTER if lat is None else [float(lat), float(lon)]
+    return int(max_bikes), center
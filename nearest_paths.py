@@ -0,0 +1,171 @@
+import math
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+# jedyny układ metryczny projektu (PUWG 1992 – cała Polska, odległości w metrach): kopia geometrii
+# ścieżek, odcinki i rzutowanie stacji przy liczeniu odległości
+METRIC_CRS = "EPSG:2180"
+METRIC_GEOM_COL = "geom_metric"
+BBOX_COLUMNS = ("xmin", "ymin", "xmax", "ymax")
+# margines bbox stacji [stopnie] przy wybieraniu kandydatów ścieżek
+BBOX_PAD_DEG = 0.02
+
+
+def column_type(con, table, column):
+    row = con.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = ? AND column_name = ?",
+        [table, column],
+    ).fetchone()
+    return row[0].upper() if row is not None else None
+
+
+def is_geometry_column(con, table, column):
+    return (column_type(con, table, column) or "").startswith("GEOMETRY")
+
+
+def geometry_as_wkt(con, table, geom_col="geom"):
+    """Wyrażenie SQL dające WKT kolumny geometrii – typu GEOMETRY (ładowanie natywne) albo już tekstu WKT"""
+    if is_geometry_column(con, table, geom_col):
+        con.execute("LOAD spatial;")
+        return f"ST_AsText({geom_col})"
+    return geom_col
+
+
+def path_table_query(source, geom_expr="geom::GEOMETRY"):
+    """SELECT dla tabeli ścieżek: geom jako GEOMETRY, bbox w stopniach (xmin/ymin/xmax/ymax),
+    kopia w METRIC_CRS, długość w metrach i flaga poprawności geometrii"""
+    return f"""
+    SELECT *, ST_Length({METRIC_GEOM_COL}) AS length_m
+    FROM (
+        SELECT
+            *,
+            ST_XMin(geom) AS xmin,
+            ST_YMin(geom) AS ymin,
+            ST_XMax(geom) AS xmax,
+            ST_YMax(geom) AS ymax,
+            ST_IsValid(geom) AS valid_geom,
+            ST_Transform(geom, 'EPSG:4326', '{METRIC_CRS}', always_xy := true) AS {METRIC_GEOM_COL}
+        FROM (SELECT * REPLACE ({geom_expr} AS geom) FROM {source})
+    )
+    """
+
+
+def project_lonlat(lon, lat, crs=METRIC_CRS):
+    from pyproj import Transformer
+
+    transformer = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+    return transformer.transform(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+
+
+def read_geometries(con, table, id_col="id", geom_col="geom", bbox=None):
+    """(ids, geometrie shapely) z tabeli DuckDB – kolumna GEOMETRY czytana jako WKB, tekst jako WKT.
+
+    bbox=(xmin, ymin, xmax, ymax) w stopniach wczytuje tylko ścieżki, których zapisane kolumny
+    bbox się z nim przecinają – zwykłe porównania kolumn, bez parsowania geometrii.
+    """
+    where, params = "", []
+    if bbox is not None and all(column_type(con, table, c) for c in BBOX_COLUMNS):
+        where = "WHERE xmax >= ? AND xmin <= ? AND ymax >= ? AND ymin <= ?"
+        params = [float(bbox[0]), float(bbox[2]), float(bbox[1]), float(bbox[3])]
+
+    if is_geometry_column(con, table, geom_col):
+        con.execute("LOAD spatial;")
+        rows = con.execute(f"SELECT {id_col}, ST_AsWKB({geom_col}) FROM {table} {where}", params).fetchall()
+        ids = np.array([r[0] for r in rows], dtype=object)
+        geoms = shapely.from_wkb(
+            np.array([None if r[1] is None else bytes(r[1]) for r in rows], dtype=object), on_invalid="ignore"
+        )
+    else:
+        df = con.execute(f"SELECT {id_col} AS path_id, {geom_col} AS geom FROM {table} {where}", params).fetchdf()
+        ids = df["path_id"].to_numpy(dtype=object)
+        geoms = shapely.from_wkt(df["geom"].to_numpy(dtype=object), on_invalid="ignore")
+    return ids, geoms
+
+
+class PathIndex:
+    """Indeks przestrzenny (STRtree) segmentów ścieżek rowerowych.
+
+    Budowany raz, odpowiada na zapytania o k najbliższych ścieżek
+    dla wielu stacji naraz, bez iloczynu kartezjańskiego stacje × ścieżki.
+    """
+
+    def __init__(self, path_ids, geoms):
+        geoms = np.asarray(geoms, dtype=object)
+        keep = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+        self.path_ids = np.asarray(path_ids, dtype=object)[keep]
+        self.geoms = geoms[keep]
+        self.tree = STRtree(self.geoms)
+
+    @classmethod
+    def from_duckdb(cls, con, table, id_col="id", geom_col="geom", bbox=None):
+        """Wczytuje geometrie z tabeli DuckDB (read_geometries) i buduje indeks."""
+        return cls(*read_geometries(con, table, id_col, geom_col, bbox))
+
+    def __len__(self):
+        return len(self.geoms)
+
+    def nearest(self, lon, lat, k=1):
+        """Zwraca (path_ids, distances) o kształcie (liczba stacji, k), rosnąco po odległości.
+
+        Odległość liczona jest w układzie współrzędnych geometrii (jak ST_Distance).
+        Brakujące wyniki to None / NaN.
+        """
+        points = shapely.points(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        n = len(points)
+        ids = np.full((n, k), None, dtype=object)
+        dist = np.full((n, k), np.nan)
+        if n == 0 or len(self) == 0:
+            return ids, dist
+
+        (point_idx, geom_idx), d = self.tree.query_nearest(
+            points, return_distance=True, all_matches=False
+        )
+        ids[point_idx, 0] = self.path_ids[geom_idx]
+        dist[point_idx, 0] = d
+        if k == 1:
+            return ids, dist
+
+        want = min(k, len(self))
+        for i, d1 in zip(point_idx, d):
+            radius = max(2 * d1, 1e-9)
+            candidates = self.tree.query(points[i], predicate="dwithin", distance=radius)
+            while len(candidates) < want:
+                radius *= 2
+                candidates = self.tree.query(points[i], predicate="dwithin", distance=radius)
+            cand_dist = shapely.distance(points[i], self.geoms[candidates])
+            order = np.argsort(cand_dist, kind="stable")[:want]
+            ids[i, :want] = self.path_ids[candidates[order]]
+            dist[i, :want] = cand_dist[order]
+        return ids, dist
+
+
+def nearest_path_distances(con, table, lon, lat, id_col="id"):
+    """Odległość [m] każdej stacji od najbliższej ścieżki, liczona na kopii metrycznej geometrii.
+
+    Wczytywane są tylko ścieżki z bbox w pobliżu stacji. Stacje, które nie mają żadnego kandydata
+    bliżej niż margines bbox, są liczone ponownie na pełnym zbiorze ścieżek.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    if len(lon) == 0:
+        return np.empty(0)
+    x, y = project_lonlat(lon, lat)
+
+    bbox = (
+        np.nanmin(lon) - BBOX_PAD_DEG,
+        np.nanmin(lat) - BBOX_PAD_DEG,
+        np.nanmax(lon) + BBOX_PAD_DEG,
+        np.nanmax(lat) + BBOX_PAD_DEG,
+    )
+    _, dist = PathIndex.from_duckdb(con, table, id_col, METRIC_GEOM_COL, bbox=bbox).nearest(x, y, k=1)
+    dist = dist[:, 0]
+
+    # ścieżka spoza bbox jest od każdej stacji dalej niż margines (w metrach, przy najwyższej szerokości)
+    pad_m = BBOX_PAD_DEG * 111320.0 * math.cos(math.radians(min(89.0, np.nanmax(np.abs(lat)) + BBOX_PAD_DEG)))
+    far = ~(dist <= pad_m)
+    if far.any():
+        _, full = PathIndex.from_duckdb(con, table, id_col, METRIC_GEOM_COL).nearest(x[far], y[far], k=1)
+        dist[far] = full[:, 0]
+    return dist
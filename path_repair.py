@@ -0,0 +1,83 @@
+import duckdb
+
+from nearest_paths import BBOX_COLUMNS, METRIC_GEOM_COL, column_type, path_table_query
+from utils import DB_PATH
+
+TABLE_PATHS = "bike_paths_clean"
+TABLE_QUARANTINE = "bike_paths_quarantine"
+# kolumny dopisywane przez path_table_query – liczone od nowa po naprawie
+DERIVED_COLUMNS = list(BBOX_COLUMNS) + ["valid_geom", METRIC_GEOM_COL, "length_m"]
+
+
+def repair_paths(con, table=TABLE_PATHS, quarantine=TABLE_QUARANTINE):
+    """Naprawia i czyści tabelę ścieżek z path_table_query na miejscu.
+
+    Wiersze z valid_geom = false przechodzą przez ST_MakeValid (z wyniku zostają tylko linie),
+    a puste, zerowej długości, nienaprawialne i powtórzone geometrie (ten sam WKB po ST_Normalize,
+    zostaje najmniejsze id) trafiają do tabeli kwarantanny z kodem przyczyny.
+    Zwraca słownik {kod przyczyny: liczba wierszy} oraz liczbę naprawionych geometrii.
+    """
+    if column_type(con, table, "valid_geom") is None:
+        print(f"[WARN] {table} nie ma kolumny valid_geom — uruchom najpierw preprocess.py.")
+        return {}, 0
+
+    # przy ponownym uruchomieniu zachowuje flagę naprawy z poprzedniego przebiegu
+    excluded = DERIVED_COLUMNS + ["geom"]
+    repaired = "geom IS NOT NULL AND NOT valid_geom"
+    if column_type(con, table, "repaired"):
+        excluded.append("repaired")
+        repaired = f"COALESCE(repaired, false) OR ({repaired})"
+
+    con.execute("LOAD spatial;")
+    con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE path_repair AS
+    SELECT
+        * EXCLUDE ({", ".join(excluded)}),
+        geom AS original_geom,
+        {repaired} AS repaired,
+        CASE WHEN valid_geom THEN geom ELSE ST_CollectionExtract(ST_MakeValid(geom), 2) END AS geom
+    FROM {table}
+    """)
+    con.execute("""
+    CREATE OR REPLACE TEMP TABLE path_repair AS
+    SELECT
+        *,
+        CASE
+            WHEN original_geom IS NULL THEN 'null_geometry'
+            WHEN geom IS NULL OR ST_IsEmpty(geom) THEN 'empty_geometry'
+            WHEN NOT ST_IsValid(geom) THEN 'invalid_geometry'
+            WHEN ST_Length(geom) = 0 THEN 'zero_length'
+            WHEN ROW_NUMBER() OVER (PARTITION BY ST_AsWKB(ST_Normalize(geom)) ORDER BY id) > 1 THEN 'duplicate_geometry'
+        END AS reason
+    FROM path_repair
+    """)
+
+    con.execute(f"""
+    CREATE OR REPLACE TABLE {quarantine} AS
+    SELECT id, reason, original_geom AS geom, now()::TIMESTAMP AS quarantined_at
+    FROM path_repair
+    WHERE reason IS NOT NULL
+    ORDER BY id
+    """)
+    clean = "(SELECT * EXCLUDE (original_geom, reason) FROM path_repair WHERE reason IS NULL ORDER BY id)"
+    con.execute(f"CREATE OR REPLACE TABLE {table} AS {path_table_query(clean, 'geom')};")
+
+    reasons = dict(con.execute(f"SELECT reason, COUNT(*) FROM {quarantine} GROUP BY reason ORDER BY reason").fetchall())
+    repaired = con.execute(f"SELECT COUNT(*) FROM {table} WHERE repaired").fetchone()[0]
+    con.execute("DROP TABLE path_repair;")
+    return reasons, repaired
+
+
+def report(reasons, repaired, table=TABLE_PATHS, quarantine=TABLE_QUARANTINE):
+    details = ", ".join(f"{reason}: {n}" for reason, n in reasons.items()) or "brak"
+    print(f"[OK] {table}: naprawiono {repaired} geometrii; do {quarantine} trafiło {sum(reasons.values())} ({details})")
+
+
+def main():
+    con = duckdb.connect(str(DB_PATH))
+    report(*repair_paths(con))
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import runpy
+import hashlib
+import argparse
+import importlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import duckdb
+
+from pipeline_metrics import current_run_id, stage_metrics
+from stations_ingest import file_digest
+from utils import DB_PATH
+
+STATE_TABLE = "pipeline_state"
+TABLE_PREFIX = "table:"
+
+
+class Stage:
+    """Etap pipeline'u: funkcja modułu (lub cały skrypt, gdy func=None) z zadeklarowanymi wejściami i wyjściami.
+
+    Zasoby to ścieżki plików/katalogów albo tabele DuckDB zapisane jako "table:<nazwa>".
+    Przy uses_con=True funkcja dostaje kursor wspólnego połączenia z bazą.
+    """
+
+    def __init__(self, name, module, func="main", inputs=(), outputs=(), uses_con=False):
+        self.name = name
+        self.module = module
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.uses_con = uses_con
+
+    def source_path(self):
+        spec = importlib.util.find_spec(self.module)
+        return spec.origin if spec is not None else None
+
+    def run(self, con):
+        if self.func is None:
+            runpy.run_module(self.module, run_name="__main__")
+            return
+        func = getattr(importlib.import_module(self.module), self.func)
+        if self.uses_con:
+            cur = con.cursor()
+            try:
+                func(cur)
+            finally:
+                cur.close()
+        else:
+            func()
+
+
+STAGES = [
+    Stage("load_paths", "load_data", "load_bike_paths", ["bike_paths.json"], ["table:bike_paths"], uses_con=True),
+    Stage("load_stations", "load_data", "load_bike_stations",
+          ["bike_stations_with_attributes.geojson"], ["table:bike_stations"], uses_con=True),
+    Stage("load_weather", "load_data", "load_weather", ["weather_data.csv"], ["table:weather"], uses_con=True),
+    Stage("preprocess", "preprocess", "main",
+          ["table:bike_paths", "table:stations_raw"],
+          ["table:bike_paths_clean", "table:bike_paths_quarantine", "table:stations_snapshots",
+           "table:stations_hourly_summary"]),
+    Stage("segments", "path_segments", "build_segments",
+          ["table:bike_paths_clean"], ["table:bike_path_segments"], uses_con=True),
+    Stage("analysis", "analysis", "main",
+          ["table:bike_paths_clean", "table:bike_path_segments", os.path.join("stations", "stations")],
+          ["table:stations_dim", "table:stations_fact", "table:stations_latest", "table:stations_attributes",
+           "table:station_path_distance",
+           os.path.join("processed", "analysis_output")]),
+    Stage("update_available_bikes", "update_available_bikes", "main",
+          [os.path.join("stations", "stations"), os.path.join("processed", "analysis_output")],
+          ["table:stations_dim", "table:stations_fact", "table:stations_latest", "table:stations_attributes",
+           os.path.join("processed", "analysis_output")]),
+    Stage("create_bike_paths_osm", "create_bike_paths_osm", "main",
+          [os.path.join("processed", "analysis_output")],
+          ["table:bike_paths_clean", "table:bike_paths_quarantine", "table:bike_path_segments",
+           os.path.join("processed", "analysis_output")]),
+    Stage("validate", "validate", "main", ["table:bike_paths"]),
+    Stage("validate_stations", "validate_stations", "validate_stations", [os.path.join("processed", "analysis_output")]),
+    Stage("tiles", "station_tiles", "build_tiles",
+          ["table:stations_hourly_summary", "table:stations_snapshots"], [os.path.join("processed", "tiles")], uses_con=True),
+    Stage("cube", "station_cube", "build_cube",
+          ["table:stations_hourly_summary", "table:stations_snapshots"], [os.path.join("processed", "cube")], uses_con=True),
+]
+
+
+def available_stages(stages=STAGES):
+    """Etapy, których moduły istnieją w tym katalogu projektu"""
+    return [s for s in stages if s.source_path() is not None]
+
+
+def dependencies(stages):
+    """Krawędzie DAG z zadeklarowanych zasobów: etap zależy od każdego wcześniejszego etapu,
+    którego wyjścia czyta lub nadpisuje albo którego wejścia nadpisuje"""
+    deps = {}
+    for i, stage in enumerate(stages):
+        reads, writes = set(stage.inputs), set(stage.outputs)
+        deps[stage.name] = {
+            earlier.name
+            for earlier in stages[:i]
+            if set(earlier.outputs) & (reads | writes) or set(earlier.inputs) & writes
+        }
+    return deps
+
+
+def select_stages(stages, targets):
+    """Wybrane etapy razem ze wszystkimi etapami, od których zależą"""
+    if not targets:
+        return stages
+    names = {s.name for s in stages}
+    unknown = set(targets) - names
+    if unknown:
+        raise ValueError(f"Nieznane etapy: {', '.join(sorted(unknown))}")
+    deps = dependencies(stages)
+    selected, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(deps[name])
+    return [s for s in stages if s.name in selected]
+
+
+def table_exists(con, table):
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [table]
+    ).fetchone()[0] > 0
+
+
+def resource_exists(con, resource):
+    if resource.startswith(TABLE_PREFIX):
+        return table_exists(con, resource[len(TABLE_PREFIX):])
+    return os.path.exists(resource)
+
+
+def resource_fingerprint(con, resource):
+    """Tabela: liczba wierszy i największy rowid; plik: rozmiar i czas modyfikacji; katalog: to samo dla każdego pliku.
+
+    Znacznik tabeli nie wymaga jej skanowania i wystarcza dla tabel zasilanych spoza pipeline'u,
+    które są tylko dopisywane (np. stations_raw). Tabele zapisywane przez etapy opisuje stage_fingerprint.
+    """
+    if resource.startswith(TABLE_PREFIX):
+        table = resource[len(TABLE_PREFIX):]
+        if not table_exists(con, table):
+            return None
+        return str(con.execute(f"SELECT COUNT(*), MAX(rowid) FROM {table}").fetchone())
+    if os.path.isfile(resource):
+        st = os.stat(resource)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+    if os.path.isdir(resource):
+        digest = hashlib.md5()
+        for root, dirs, files in os.walk(resource):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                digest.update(f"{os.path.relpath(path, resource)}:{st.st_size}:{st.st_mtime_ns}\n".encode("utf-8"))
+        return digest.hexdigest()
+    return None
+
+
+def last_run(con, stage_name):
+    """Znacznik ostatniego udanego przebiegu etapu (zmienia się tylko wtedy, gdy etap się wykonał)"""
+    row = con.execute(f"SELECT fingerprint, finished_at FROM {STATE_TABLE} WHERE stage = ?", [stage_name]).fetchone()
+    return None if row is None else f"{row[0]}@{row[1]}"
+
+
+def stage_fingerprint(con, stage, plan):
+    """Odcisk etapu liczony przed przebiegiem: kod modułu i stan wejść.
+
+    Wejście zapisywane przez któryś etap planu zmienia się tylko wtedy, gdy ten etap się wykona,
+    więc do odcisku trafiają znaczniki ostatnich przebiegów wcześniejszych etapów, które je zapisują –
+    bez czytania tabel. Dotyczy to też wejść nadpisywanych przez ten etap albo etap późniejszy
+    (np. processed/analysis_output), których zawartość po przebiegu nie jest już tą przeczytaną.
+    Pozostałe wejścia (pliki źródłowe, tabele zasilane z zewnątrz) opisuje resource_fingerprint.
+    """
+    position = [s.name for s in plan].index(stage.name)
+    parts = {"code": file_digest(stage.source_path())}
+    for resource in stage.inputs:
+        if any(resource in s.outputs for s in plan):
+            parts[resource] = [last_run(con, s.name) for s in plan[:position] if resource in s.outputs]
+        else:
+            parts[resource] = resource_fingerprint(con, resource)
+    return hashlib.md5(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def create_state_table(con):
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+        stage VARCHAR PRIMARY KEY,
+        fingerprint VARCHAR,
+        finished_at TIMESTAMP
+    );
+    """)
+
+
+def is_fresh(con, stage, fingerprint):
+    """Etap jest aktualny, gdy wejścia i kod się nie zmieniły od ostatniego udanego przebiegu, a wyjścia istnieją"""
+    row = con.execute(f"SELECT fingerprint FROM {STATE_TABLE} WHERE stage = ?", [stage.name]).fetchone()
+    if row is None or row[0] != fingerprint:
+        return False
+    return all(resource_exists(con, r) for r in stage.outputs)
+
+
+def record_run(con, stage, fingerprint):
+    # odcisk sprzed przebiegu – opisuje wejścia, które etap faktycznie przeczytał
+    con.execute(
+        f"INSERT OR REPLACE INTO {STATE_TABLE} VALUES (?, ?, now()::TIMESTAMP)",
+        [stage.name, fingerprint],
+    )
+
+
+def run_stage(con, stage, force, plan):
+    cur = con.cursor()
+    try:
+        fingerprint = stage_fingerprint(cur, stage, plan)
+        if not force and is_fresh(cur, stage, fingerprint):
+            return "skipped"
+        print(f"[RUN] {stage.name}")
+        with stage_metrics(stage.name, cur, kind="pipeline"):
+            try:
+                stage.run(con)
+            except SystemExit as e:
+                if e.code not in (None, 0):
+                    raise RuntimeError(f"Etap {stage.name} zakończył się kodem {e.code}") from e
+        record_run(cur, stage, fingerprint)
+        return "done"
+    finally:
+        cur.close()
+
+
+def run_pipeline(con, stages, force=False, workers=4, plan=None):
+    """Uruchamia etapy w kolejności DAG; niezależne etapy idą równolegle w wątkach.
+
+    plan to pełna lista etapów, względem której liczone są odciski (domyślnie stages) – dzięki temu
+    uruchomienie wybranych etapów nie zmienia ich odcisków. Błąd etapu pomija etapy od niego zależne.
+    Zwraca słownik {etap: done|skipped|failed|blocked}.
+    """
+    plan = plan or stages
+    create_state_table(con)
+    deps = dependencies(stages)
+    by_name = {s.name: s for s in stages}
+    status = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while len(status) < len(stages):
+            for stage in stages:
+                if stage.name in status or stage.name in running.values():
+                    continue
+                stage_deps = deps[stage.name] & by_name.keys()
+                if any(status.get(d) in ("failed", "blocked") for d in stage_deps):
+                    status[stage.name] = "blocked"
+                    print(f"[SKIP] {stage.name} — nie powiódł się etap, od którego zależy")
+                elif all(d in status for d in stage_deps):
+                    running[pool.submit(run_stage, con, stage, force, plan)] = stage.name
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    status[name] = future.result()
+                except Exception as e:
+                    status[name] = "failed"
+                    print(f"[ERROR] {name}: {e}")
+                else:
+                    if status[name] == "skipped":
+                        print(f"[INFO] {name} aktualny — pomijam.")
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Uruchamia pipeline stacji rowerowych jako DAG etapów.")
+    parser.add_argument("stages", nargs="*", help="etapy do uruchomienia (domyślnie wszystkie) – zależności są dodawane")
+    # --full wymusza przebieg etapów, ale nie przełącza ich w tryb pełnej przebudowy (np. preprocess.py --full)
+    parser.add_argument("--full", action="store_true", help="uruchom wybrane etapy niezależnie od odcisków wejść")
+    parser.add_argument("--workers", type=int, default=4, help="liczba równoległych etapów")
+    parser.add_argument("--dry-run", action="store_true", help="tylko pokaż, które etapy zostałyby uruchomione")
+    # pozostałe flagi (np. --ndjson, --gzip) zostają w sys.argv dla skryptów etapów
+    args, _ = parser.parse_known_args()
+
+    plan = available_stages()
+    stages = select_stages(plan, args.stages)
+    con = duckdb.connect(str(DB_PATH))
+    try:
+        if args.dry_run:
+            create_state_table(con)
+            deps = dependencies(stages)
+            for stage in stages:
+                state = "uruchom" if args.full or not is_fresh(con, stage, stage_fingerprint(con, stage, plan)) else "aktualny"
+                after = ", ".join(sorted(deps[stage.name])) or "-"
+                print(f"{stage.name:<24} {state:<10} po: {after}")
+            return
+        print(f"[INFO] Przebieg {current_run_id()} — pomiary w tabeli pipeline_metrics")
+        status = run_pipeline(con, stages, force=args.full, workers=args.workers, plan=plan)
+    finally:
+        con.close()
+
+    print("\n===== PODSUMOWANIE =====")
+    for stage in stages:
+        print(f"{stage.name:<24} {status[stage.name]}")
+    if any(s in ("failed", "blocked") for s in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
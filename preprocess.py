@@ -1,53 +1,133 @@
+import sys
 import duckdb
 from utils import DB_PATH
+from nearest_paths import path_table_query
+from path_repair import repair_paths, report
+from pipeline_metrics import StageMetrics
 
 
-con = duckdb.connect(str(DB_PATH))
-con.execute("LOAD spatial;")
+def get_state(con, key):
+    row = con.execute("SELECT value FROM preprocess_state WHERE key = ?", [key]).fetchone()
+    return row[0] if row else None
 
 
-con.execute("DROP TABLE IF EXISTS bike_paths_clean;")
-con.execute('''
-CREATE TABLE bike_paths_clean AS
-SELECT
-*,
-ST_Length(geom) AS length_m,
-ST_IsValid(geom) AS valid_geom
-FROM bike_paths;
-''')
+def set_state(con, key, value):
+    con.execute("INSERT OR REPLACE INTO preprocess_state VALUES (?, ?)", [key, str(value)])
 
 
-con.execute("DROP TABLE IF EXISTS stations_snapshots;")
-con.execute('''
-CREATE TABLE stations_snapshots AS
-SELECT
-json_extract_scalar(value, '$.station_id')::INTEGER AS station_id,
-json_extract_scalar(value, '$.last_update') AS last_update,
-json_extract_scalar(value, '$.available_bikes')::INTEGER AS available_bikes,
-json_extract_scalar(value, '$.free_places')::INTEGER AS free_places,
-json_extract_scalar(value, '$.latitude')::DOUBLE AS latitude,
-json_extract_scalar(value, '$.longitude')::DOUBLE AS longitude
-FROM (SELECT json_parse(json) AS value FROM stations_raw)
-WHERE json_extract_scalar(value, '$.latitude') IS NOT NULL;
-''')
+def main(full=False):
+    """Domyślnie przetwarza tylko nowe dane; full=True (w CLI "--full") przebudowuje wszystko od zera"""
+    con = duckdb.connect(str(DB_PATH))
+    con.execute("LOAD spatial;")
+    con.execute("CREATE TABLE IF NOT EXISTS preprocess_state (key VARCHAR PRIMARY KEY, value VARCHAR);")
+    metrics = StageMetrics("preprocess", con)
 
-con.execute("ALTER TABLE stations_snapshots ADD COLUMN geom GEOMETRY;")
-con.execute("UPDATE stations_snapshots SET geom = ST_Point(longitude, latitude) WHERE longitude IS NOT NULL AND latitude IS NOT NULL;")
+    paths_key = str(con.execute("SELECT COUNT(*), COALESCE(SUM(hash(bike_paths)::HUGEINT), 0) FROM bike_paths").fetchone())
+    if full or get_state(con, "bike_paths") != paths_key:
+        con.execute("DROP TABLE IF EXISTS bike_paths_clean;")
+        # geometria jako GEOMETRY z bbox i kopią metryczną – length_m liczone w metrach
+        metrics.execute(f"CREATE TABLE bike_paths_clean AS {path_table_query('bike_paths')};", label="bike_paths_clean")
+        # niepoprawne geometrie naprawiane, puste/zerowe/powtórzone odkładane do kwarantanny
+        report(*repair_paths(con))
+        set_state(con, "bike_paths", paths_key)
 
+    # znacznik przyrostowy w kolejności dopisywania: liczba wierszy stations_raw już przetworzonych.
+    # stations_raw jest tylko dopisywana, więc nowe wiersze to rowid >= znacznik – filtr trafia do skanu
+    # tabeli, zanim JSON zostanie zdekodowany. Po usunięciu wierszy z stations_raw trzeba uruchomić "--full".
+    raw_rows = con.execute("SELECT COUNT(*) FROM stations_raw").fetchone()[0]
+    raw_rows_done = get_state(con, "stations_raw_rows") if not full else None
+    if raw_rows_done is not None and int(raw_rows_done) > raw_rows:
+        print("[WARN] stations_raw ma mniej wierszy niż przy poprzednim przebiegu — przebudowa od zera.")
+        raw_rows_done = None
 
+    # wstawienie do stations_snapshots, upsert podsumowania i znacznik w jednej transakcji – przerwany
+    # przebieg nie zostawia wierszy, które kolejny przebieg dopisałby i policzył w sumach drugi raz
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if raw_rows_done is None:
+            raw_rows_done = 0
+            con.execute("DROP TABLE IF EXISTS stations_snapshots;")
+            con.execute("DROP TABLE IF EXISTS stations_hourly_summary;")
 
-con.execute("DROP TABLE IF EXISTS stations_hourly_summary;")
-con.execute('''
-CREATE TABLE stations_hourly_summary AS
-SELECT
-station_id,
-date_trunc('hour', TO_TIMESTAMP(last_update)) AS hour,
-AVG(available_bikes) AS avg_available_bikes,
-MIN(available_bikes) AS min_available_bikes,
-MAX(available_bikes) AS max_available_bikes
-FROM stations_snapshots
-GROUP BY station_id, date_trunc('hour', TO_TIMESTAMP(last_update));
-''')
+        # każdy rekord dekodowany raz do typowanej struktury; geometria liczona w tym samym CREATE TABLE AS
+        metrics.execute(f'''
+        CREATE OR REPLACE TEMP TABLE new_snapshots AS
+        SELECT
+        r.station_id,
+        r.last_update,
+        r.available_bikes,
+        r.free_places,
+        r.latitude,
+        r.longitude,
+        ST_Point(r.longitude, r.latitude) AS geom
+        FROM (
+            SELECT json_transform(json, '{{
+                "station_id": "INTEGER",
+                "last_update": "VARCHAR",
+                "available_bikes": "INTEGER",
+                "free_places": "INTEGER",
+                "latitude": "DOUBLE",
+                "longitude": "DOUBLE"
+            }}') AS r
+            FROM stations_raw
+            WHERE rowid >= $1 AND rowid < $2
+        )
+        WHERE r.latitude IS NOT NULL;
+        ''', [int(raw_rows_done), raw_rows], label="new_snapshots")
 
+        con.execute("CREATE TABLE IF NOT EXISTS stations_snapshots AS SELECT * FROM new_snapshots LIMIT 0;")
+        metrics.execute("INSERT INTO stations_snapshots SELECT * FROM new_snapshots;", label="stations_snapshots")
 
-con.close()
+        # sumy i liczniki pozwalają scalać średnie godzinowe z kolejnych przebiegów
+        con.execute('''
+        CREATE TABLE IF NOT EXISTS stations_hourly_summary (
+        station_id INTEGER,
+        hour TIMESTAMPTZ,
+        avg_available_bikes DOUBLE,
+        min_available_bikes INTEGER,
+        max_available_bikes INTEGER,
+        sum_available_bikes BIGINT,
+        count_available_bikes BIGINT,
+        PRIMARY KEY (station_id, hour)
+        );
+        ''')
+        metrics.execute('''
+        INSERT INTO stations_hourly_summary
+        SELECT
+        station_id,
+        date_trunc('hour', TO_TIMESTAMP(last_update)) AS hour,
+        AVG(available_bikes) AS avg_available_bikes,
+        MIN(available_bikes) AS min_available_bikes,
+        MAX(available_bikes) AS max_available_bikes,
+        COALESCE(SUM(available_bikes), 0) AS sum_available_bikes,
+        COUNT(available_bikes) AS count_available_bikes
+        FROM new_snapshots
+        WHERE station_id IS NOT NULL AND last_update IS NOT NULL
+        GROUP BY station_id, date_trunc('hour', TO_TIMESTAMP(last_update))
+        ON CONFLICT (station_id, hour) DO UPDATE SET
+        avg_available_bikes = (sum_available_bikes + EXCLUDED.sum_available_bikes)
+            / NULLIF(count_available_bikes + EXCLUDED.count_available_bikes, 0),
+        min_available_bikes = LEAST(min_available_bikes, EXCLUDED.min_available_bikes),
+        max_available_bikes = GREATEST(max_available_bikes, EXCLUDED.max_available_bikes),
+        sum_available_bikes = sum_available_bikes + EXCLUDED.sum_available_bikes,
+        count_available_bikes = count_available_bikes + EXCLUDED.count_available_bikes;
+        ''', label="stations_hourly_summary")
+
+        new_rows = con.execute("SELECT COUNT(*) FROM new_snapshots").fetchone()[0]
+        set_state(con, "stations_raw_rows", raw_rows)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+    print(f"[INFO] Przetworzono {new_rows} nowych wierszy stations_raw (tryb {'pełny' if full else 'przyrostowy'})")
+
+    metrics.rows_in = raw_rows - int(raw_rows_done)
+    metrics.rows_out = new_rows
+    metrics.finish()
+
+    con.close()
+
+
+if __name__ == "__main__":
+    main(full="--full" in sys.argv)
@@ -1,14 +1,22 @@
 import duckdb
-import pandas as pd
 import os
-import json
 import math
+import time
+import numpy as np
+from scipy.spatial import cKDTree
 
-DB_FILE = "mydatabase.duckdb"
+from stations_ingest import DIM_TABLE, data_snapshot_date, load_new_snapshots_to_duckdb
+from processed_store import ANALYSIS_DATASET, write_analysis_output
+from nearest_paths import geometry_as_wkt
+from pipeline_metrics import stage_metrics
+from utils import DB_PATH
+
+DB_FILE = str(DB_PATH)
 STATIONS_FOLDER = r"C:\Users\mszto\OneDrive\Pulpit\projekt_bazy\stations\stations"
 TABLE_PATHS = "bike_paths_clean"
+TABLE_STATIONS = DIM_TABLE
 
-OUTPUT_CSV = "processed/analysis_output.csv"
+EARTH_RADIUS = 6371000.0
 os.makedirs("processed", exist_ok=True)
 
 
@@ -21,6 +29,66 @@ def haversine(lat1, lon1, lat2, lon2):
     return 2*R*math.atan2(math.sqrt(a), math.sqrt(1-a))
 
 
+def haversine_np(lat1, lon1, lat2, lon2):
+    """Wektorowa wersja haversine na tablicach float64 (z broadcastingiem)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def to_unit_sphere(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class SegmentIndex:
+    """Odcinki ścieżek jako tablice float64 (lat1, lon1, lat2, lon2) z KD-tree na sferze jednostkowej.
+
+    KD-tree indeksuje środki odcinków; odcinek bliższy niż bieżące minimum d ma środek
+    w promieniu d + (połowa najdłuższego odcinka), więc tylko te odcinki liczymy dokładnie.
+    """
+
+    def __init__(self, segments):
+        self.segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        lat1, lon1, lat2, lon2 = self.segments.T
+        self.max_half_length = float(haversine_np(lat1, lon1, lat2, lon2).max()) / 2
+        self.tree = cKDTree(to_unit_sphere((lat1 + lat2) / 2, (lon1 + lon2) / 2))
+
+    def __len__(self):
+        return len(self.segments)
+
+    def segment_distances(self, lat, lon, idx):
+        """Odległość punkt–odcinek [m] dla odcinków idx (rzut na odcinek w lokalnym układzie płaskim)."""
+        seg = self.segments[idx]
+        lat1, lon1, lat2, lon2 = seg[..., 0], seg[..., 1], seg[..., 2], seg[..., 3]
+        cos_lat = np.cos(np.radians(lat))
+        x1, y1 = (lon1 - lon) * cos_lat, lat1 - lat
+        dx, dy = (lon2 - lon1) * cos_lat, lat2 - lat1
+        length2 = dx * dx + dy * dy
+        t = np.where(length2 > 0, -(x1 * dx + y1 * dy) / np.where(length2 > 0, length2, 1.0), 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        return haversine_np(lat, lon, lat1 + t * (lat2 - lat1), lon1 + t * (lon2 - lon1))
+
+    def min_distances(self, lat, lon, k=8):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if len(lat) == 0:
+            return np.empty(0)
+        xyz = to_unit_sphere(lat, lon)
+        k = min(k, len(self))
+
+        _, nearest = self.tree.query(xyz, k=k)
+        nearest = nearest.reshape(len(lat), -1)
+        best = self.segment_distances(lat[:, None], lon[:, None], nearest).min(axis=1)
+
+        radius = best + self.max_half_length
+        chord = 2 * np.sin(np.minimum(radius / (2 * EARTH_RADIUS), np.pi / 2))
+        for i, candidates in enumerate(self.tree.query_ball_point(xyz, chord)):
+            if len(candidates) > k:
+                best[i] = min(best[i], self.segment_distances(lat[i], lon[i], np.asarray(candidates)).min())
+        return best
+
+
 def parse_wkt_points(wkt):
     if not isinstance(wkt, str):
         return []
@@ -57,44 +125,23 @@ def parse_wkt_points(wkt):
 
 
 
-def load_stations():
-    stations = []
-
-    for root, _, files in os.walk(STATIONS_FOLDER):
-        for file in files:
-            if not file.endswith(".json"):
-                continue
-            path = os.path.join(root, file)
-
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            except:
-                continue
-
-            items = data.get("stations_data") or []
-            for s in items:
-                lat = s.get("geoCoords", {}).get("lat")
-                lon = s.get("geoCoords", {}).get("lng")
-                if lat is None or lon is None:
-                    continue
-
-                stations.append({
-                    "station_id": str(s.get("uid")),
-                    "name": s.get("name"),
-                    "lat": float(lat),
-                    "lon": float(lon),
-                })
-
-    df = pd.DataFrame(stations)
-    df = df.drop_duplicates(subset=["station_id"])
-    return df
+def load_stations(con):
+    """Dopisuje nowe lub zmienione pliki JSON (manifest) i zwraca bieżące wersje stacji z wymiaru"""
+    added = load_new_snapshots_to_duckdb(con, STATIONS_FOLDER)
+    print(f"[INFO] Tabela {TABLE_STATIONS} zaktualizowana w DuckDB (+{added} pomiarów)")
+    return con.execute(f"""
+    SELECT station_id, name, lat, lon
+    FROM {TABLE_STATIONS}
+    WHERE valid_to IS NULL AND lat IS NOT NULL AND lon IS NOT NULL
+    ORDER BY station_id
+    """).fetchdf()
 
 
 
 def load_paths_from_duckdb(con):
     try:
-        rows = con.execute(f"SELECT id, geom FROM {TABLE_PATHS} ORDER BY id").fetchall()
+        geom = geometry_as_wkt(con, TABLE_PATHS)
+        rows = con.execute(f"SELECT id, {geom} FROM {TABLE_PATHS} ORDER BY id").fetchall()
     except Exception as e:
         print(f"[ERROR] Nie można odczytać {TABLE_PATHS}: {e}")
         return []
@@ -112,6 +159,26 @@ def load_paths_from_duckdb(con):
 
 
 
+def load_path_segments(con):
+    """Odcinki kolejnych wierzchołków ścieżek jako tablica (n, 4): lat1, lon1, lat2, lon2."""
+    try:
+        geom = geometry_as_wkt(con, TABLE_PATHS)
+        rows = con.execute(f"SELECT id, {geom} FROM {TABLE_PATHS} ORDER BY id").fetchall()
+    except Exception as e:
+        print(f"[ERROR] Nie można odczytać {TABLE_PATHS}: {e}")
+        return np.empty((0, 4))
+
+    segments = []
+    for row in rows:
+        pts = parse_wkt_points(row[1])
+        if len(pts) == 1:
+            pts = pts * 2
+        segments.extend(a + b for a, b in zip(pts, pts[1:]))
+
+    return np.array(segments, dtype=np.float64).reshape(-1, 4)
+
+
+
 def compute_min_distance(st_lat, st_lon, path_points):
     best = float("inf")
     for lat, lon in path_points:
@@ -122,34 +189,47 @@ def compute_min_distance(st_lat, st_lon, path_points):
 
 
 
-def main():
+def main(mode="batched"):
     print("[INFO] Łączenie z DuckDB…")
     con = duckdb.connect(DB_FILE)
 
-    print("[INFO] Wczytywanie stacji…")
-    df = load_stations()
-    print(f"[INFO] Wczytano {len(df)} stacji.")
-
-    print("[INFO] Wczytywanie ścieżek rowerowych z DB…")
-    path_points = load_paths_from_duckdb(con)
-
-    if not path_points:
-        print("[WARN] Brak geometrii ścieżek — liczę dystans do centrum Warszawy.")
-        path_points = [(52.2297, 21.0122)]
-
-    print(f"[INFO] Punkty ścieżek: {len(path_points)}")
-
-    print("[INFO] Liczenie minimalnych odległości…")
-    distances = []
-
-    for _, row in df.iterrows():
-        dist = compute_min_distance(row["lat"], row["lon"], path_points)
-        distances.append(dist)
-
-    df["min_distance_m"] = distances
-    
-    df.to_csv(OUTPUT_CSV, index=False)
-    print(f"[OK] Zapisano: {OUTPUT_CSV}")
+    with stage_metrics("analysis", con) as m:
+        print("[INFO] Wczytywanie stacji…")
+        with m.step("load_stations"):
+            df = load_stations(con)
+        m.rows_in = m.rows_out = len(df)
+        print(f"[INFO] Wczytano {len(df)} stacji.")
+
+        print("[INFO] Wczytywanie ścieżek rowerowych z DB…")
+        start = time.perf_counter()
+        with m.step(f"station_distances ({mode})"):
+            if mode == "batched":
+                segments = load_path_segments(con)
+                if len(segments) == 0:
+                    print("[WARN] Brak geometrii ścieżek — liczę dystans do centrum Warszawy.")
+                    segments = np.array([[52.2297, 21.0122, 52.2297, 21.0122]])
+                print(f"[INFO] Odcinki ścieżek: {len(segments)}")
+
+                print("[INFO] Liczenie minimalnych odległości…")
+                df["min_distance_m"] = SegmentIndex(segments).min_distances(df["lat"].to_numpy(), df["lon"].to_numpy())
+            elif mode == "loop":
+                path_points = load_paths_from_duckdb(con)
+                if not path_points:
+                    print("[WARN] Brak geometrii ścieżek — liczę dystans do centrum Warszawy.")
+                    path_points = [(52.2297, 21.0122)]
+                print(f"[INFO] Punkty ścieżek: {len(path_points)}")
+
+                print("[INFO] Liczenie minimalnych odległości…")
+                df["min_distance_m"] = [
+                    compute_min_distance(row["lat"], row["lon"], path_points) for _, row in df.iterrows()
+                ]
+            else:
+                raise ValueError(f"Nieznany tryb liczenia odległości: {mode}")
+        print(f"[INFO] Czas liczenia odległości: {time.perf_counter() - start:.2f} s")
+
+        with m.step("write_analysis_output"):
+            snapshot_date = write_analysis_output(df, snapshot_date=data_snapshot_date(con))
+        print(f"[OK] Zapisano: {ANALYSIS_DATASET} (partycja {snapshot_date})")
     print("[DONE] Analiza zakończona.")
 
 
@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import contextlib
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+
+from pipeline_metrics import peak_rss_mb
+from synthetic_city import generate_city, write_bike_paths_json, write_snapshots
+
+BENCH_DIR = os.path.join("processed", "benchmarks")
+RESULTS_FILE = os.path.join(BENCH_DIR, "results.jsonl")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+
+# (stacje, ścieżki, pliki snapshotów)
+SIZES = {
+    "small": (200, 1000, 24),
+    "medium": (1000, 5000, 144),
+    "large": (5000, 25000, 720),
+}
+# pętle stacje × ścieżki (lub × wierzchołki) powyżej tej liczby par są pomijane
+MAX_PAIRS = 5_000_000
+REGRESSION_TOLERANCE = 0.2
+# różnice czasu poniżej tej wartości to szum pomiaru, nie regresja
+MIN_DELTA_S = 0.02
+
+
+def spatial_available():
+    import duckdb
+
+    try:
+        duckdb.connect().execute("LOAD spatial;")
+    except duckdb.Error:
+        return False
+    return True
+
+
+def path_vertices(geoms):
+    """Wierzchołki ścieżek jako (lat, lon) i odcinki (n, 4): lat1, lon1, lat2, lon2"""
+    coords, line = shapely.get_coordinates(geoms, return_index=True)
+    same = line[1:] == line[:-1]
+    segments = np.column_stack([coords[:-1, 1], coords[:-1, 0], coords[1:, 1], coords[1:, 0]])[same]
+    return coords[:, ::-1], segments
+
+
+# --- silniki odległości: setup(city, workdir) -> (funkcja mierzona, liczba wierszy wyniku) ---
+
+def setup_strtree(city, workdir):
+    from create_bike_paths_osm import vectorized_min_distances
+
+    stations, path_ids, geoms = city
+    return lambda: vectorized_min_distances(stations, path_ids, geoms), len(stations)
+
+
+def setup_shapely_loop(city, workdir):
+    from create_bike_paths_osm import loop_min_distances
+
+    stations, _, geoms = city
+    return lambda: loop_min_distances(stations, geoms), len(stations)
+
+
+def setup_kdtree_segments(city, workdir):
+    from analysis import SegmentIndex
+
+    stations, _, geoms = city
+    _, segments = path_vertices(geoms)
+    lat, lon = stations["lat"].to_numpy(), stations["lon"].to_numpy()
+    return lambda: SegmentIndex(segments).min_distances(lat, lon), len(stations)
+
+
+def setup_haversine_loop(city, workdir):
+    from analysis import compute_min_distance
+
+    stations, _, geoms = city
+    points = [tuple(p) for p in path_vertices(geoms)[0]]
+    return lambda: [compute_min_distance(lat, lon, points) for lat, lon in zip(stations["lat"], stations["lon"])], len(stations)
+
+
+def setup_duckdb_spatial(city, workdir):
+    import duckdb
+    import pandas as pd
+    from nearest_paths import nearest_path_distances, path_table_query
+
+    stations, path_ids, geoms = city
+    con = duckdb.connect()
+    con.execute("LOAD spatial;")
+    con.register("tmp_paths_df", pd.DataFrame({"id": path_ids, "geom": shapely.to_wkb(geoms)}))
+    con.execute(f"CREATE TABLE bike_paths_clean AS {path_table_query('tmp_paths_df', 'ST_GeomFromWKB(geom)')};")
+    return lambda: nearest_path_distances(con, "bike_paths_clean", stations["lon"], stations["lat"]), len(stations)
+
+
+# --- loadery: setup(city, workdir, liczba snapshotów) ---
+
+def setup_ingest_snapshots(city, workdir, n_snapshots):
+    import duckdb
+    from stations_ingest import load_new_snapshots_to_duckdb
+
+    stations = city[0]
+    folder = os.path.join(workdir, "stations")
+    write_snapshots(stations, n_snapshots, folder)
+    # każde powtórzenie na nowej bazie – manifest pominąłby już wczytane pliki
+    return lambda: load_new_snapshots_to_duckdb(duckdb.connect(), folder), len(stations) * n_snapshots
+
+
+def setup_load_paths(city, workdir, n_snapshots, native):
+    import duckdb
+    from load_data import load_bike_paths
+
+    _, path_ids, geoms = city
+    path = write_bike_paths_json(path_ids, geoms, os.path.join(workdir, "bike_paths.json"))
+    return lambda: load_bike_paths(duckdb.connect(), path, native=native), len(path_ids)
+
+
+def path_pairs(n_stations, n_paths, n_vertices):
+    return n_stations * n_paths
+
+
+def vertex_pairs(n_stations, n_paths, n_vertices):
+    return n_stations * n_vertices
+
+
+# nazwa: (setup, wymaga rozszerzenia spatial, liczba par dla pętli kwadratowych albo None)
+ENGINES = {
+    "strtree": (setup_strtree, False, None),
+    "kdtree_segments": (setup_kdtree_segments, False, None),
+    "shapely_loop": (setup_shapely_loop, False, path_pairs),
+    "haversine_loop": (setup_haversine_loop, False, vertex_pairs),
+    "duckdb_spatial": (setup_duckdb_spatial, True, None),
+    "ingest_snapshots": (setup_ingest_snapshots, False, None),
+    "load_paths_pandas": (partial(setup_load_paths, native=False), False, None),
+    "load_paths_native": (partial(setup_load_paths, native=True), True, None),
+}
+LOADERS = {"ingest_snapshots", "load_paths_pandas", "load_paths_native"}
+
+
+def run_case(engine, size, seed=0, repeat=3):
+    """Jeden przypadek w osobnym procesie: dane generowane poza pomiarem, czas najlepszego z powtórzeń"""
+    n_stations, n_paths, n_snapshots = SIZES[size]
+    city = generate_city(n_stations, n_paths, seed)
+    setup = ENGINES[engine][0]
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            func, rows = setup(city, workdir, n_snapshots) if engine in LOADERS else setup(city, workdir)
+            walls, cpus = [], []
+            for _ in range(repeat):
+                wall, cpu = time.perf_counter(), time.process_time()
+                func()
+                walls.append(time.perf_counter() - wall)
+                cpus.append(time.process_time() - cpu)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    best = min(range(repeat), key=walls.__getitem__)
+    return {
+        "wall_s": walls[best],
+        "cpu_s": cpus[best],
+        "peak_rss_mb": peak_rss_mb(),
+        "rows": rows,
+        "rows_per_s": rows / walls[best] if walls[best] > 0 else None,
+    }
+
+
+def run_benchmarks(engines, sizes, seed=0, repeat=3, max_pairs=MAX_PAIRS):
+    """Uruchamia każdą parę silnik × rozmiar w świeżym procesie (spawn), żeby szczytowe RSS dotyczyło jednego przypadku"""
+    has_spatial = spatial_available()
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in sizes:
+        n_stations, n_paths, n_snapshots = SIZES[size]
+        n_vertices = len(path_vertices(generate_city(n_stations, n_paths, seed)[2])[0])
+        for engine in engines:
+            _, needs_spatial, pairs = ENGINES[engine]
+            record = {
+                "case": f"{engine}@{size}",
+                "engine": engine,
+                "size": size,
+                "n_stations": n_stations,
+                "n_paths": n_paths,
+                "n_snapshots": n_snapshots,
+                "seed": seed,
+            }
+            if needs_spatial and not has_spatial:
+                record["status"] = "skipped: brak rozszerzenia spatial"
+            elif pairs is not None and pairs(n_stations, n_paths, n_vertices) > max_pairs:
+                record["status"] = f"skipped: ponad {max_pairs} par"
+            else:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    try:
+                        record.update(pool.submit(run_case, engine, size, seed, repeat).result())
+                        record["status"] = "ok"
+                    except Exception as e:
+                        record["status"] = f"failed: {e}"
+            print(format_record(record))
+            results.append(record)
+    return results
+
+
+def format_record(record):
+    if record["status"] != "ok":
+        return f"{record['case']:<28} {record['status']}"
+    rss = f"{record['peak_rss_mb']:.0f} MB" if record["peak_rss_mb"] is not None else "-"
+    return (f"{record['case']:<28} {record['wall_s']:>9.3f} s  cpu {record['cpu_s']:>8.3f} s  "
+            f"RSS {rss:>8}  {record['rows_per_s']:>12,.0f} wierszy/s")
+
+
+def append_results(results, path=RESULTS_FILE):
+    """Dopisuje przebieg (z datą i platformą) jako wiersze JSON do pliku wyników"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    run_at = datetime.datetime.now().isoformat(timespec="seconds")
+    with open(path, "a", encoding="utf-8") as f:
+        for record in results:
+            f.write(json.dumps({"run_at": run_at, "platform": platform.platform(), **record}) + "\n")
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    """Zapisuje udane przypadki jako nowy punkt odniesienia (pozostałe wpisy bazowe zostają)"""
+    baseline = load_baseline(path)
+    baseline.update({r["case"]: r for r in results if r["status"] == "ok"})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def find_regressions(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """[(przypadek, metryka, bazowa, bieżąca)] dla czasu i RSS gorszych od bazowych o więcej niż tolerance"""
+    regressions = []
+    for record in results:
+        base = baseline.get(record["case"])
+        if record["status"] != "ok" or base is None:
+            continue
+        if record["wall_s"] > base["wall_s"] * (1 + tolerance) and record["wall_s"] - base["wall_s"] > MIN_DELTA_S:
+            regressions.append((record["case"], "wall_s", base["wall_s"], record["wall_s"]))
+        if None not in (record["peak_rss_mb"], base.get("peak_rss_mb")) and record["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append((record["case"], "peak_rss_mb", base["peak_rss_mb"], record["peak_rss_mb"]))
+    return regressions
+
+
+def split_names(value, known, what):
+    names = [n for n in value.split(",") if n]
+    unknown = set(names) - set(known)
+    if unknown:
+        raise SystemExit(f"Nieznane {what}: {', '.join(sorted(unknown))} (dostępne: {', '.join(known)})")
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark silników odległości i loaderów na syntetycznym mieście.")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="silniki i loadery oddzielone przecinkami")
+    parser.add_argument("--sizes", default="small,medium", help=f"rozmiary: {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="liczba powtórzeń (liczy się najlepsze)")
+    parser.add_argument("--seed", type=int, default=0, help="ziarno generatora danych")
+    parser.add_argument("--max-pairs", type=int, default=MAX_PAIRS, help="limit par dla pętli kwadratowych")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="dopuszczalne pogorszenie (0.2 = 20%%)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="plik z wynikami bazowymi")
+    parser.add_argument("--save-baseline", action="store_true", help="zapisz wyniki jako nowe wartości bazowe")
+    args = parser.parse_args()
+
+    engines = split_names(args.engines, ENGINES, "silniki")
+    sizes = split_names(args.sizes, SIZES, "rozmiary")
+    results = run_benchmarks(engines, sizes, args.seed, args.repeat, args.max_pairs)
+    append_results(results)
+    print(f"\n[OK] Wyniki dopisane do: {RESULTS_FILE}")
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"[OK] Zapisano wartości bazowe: {args.baseline}")
+        return
+
+    regressions = find_regressions(results, load_baseline(args.baseline), args.tolerance)
+    for case, metric, base, current in regressions:
+        print(f"[REGRESJA] {case} {metric}: {base:.3f} → {current:.3f} ({current / base - 1:+.0%})")
+    if regressions:
+        sys.exit(1)
+
+
+# main() pod ochroną __main__ – procesy przypadków (spawn) importują ten moduł ponownie
+if __name__ == "__main__":
+    main()
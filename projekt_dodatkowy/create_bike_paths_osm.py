@@ -1,22 +1,40 @@
 # create_bike_paths_osm.py
 import os
 import sys
+import json
 import math
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
 import duckdb
 import pandas as pd
 
-def install_check():
+from processed_store import latest_snapshot_date, read_analysis_output, write_analysis_output
+from utils import DB_PATH
+
+def install_check(need_osmnx=True):
     try:
-        import osmnx as ox  # noqa: F401
+        if need_osmnx:
+            import osmnx as ox  # noqa: F401
         import geopandas as gpd  # noqa: F401
         from shapely import wkt  # noqa: F401
     except Exception as e:
         print("Brak wymaganych pakietów (osmnx/geopandas/shapely). Zainstaluj: pip install osmnx geopandas shapely")
         raise e
 
-DB_FILE = "mydatabase.duckdb"
+DB_FILE = str(DB_PATH)
 TABLE_PATHS = "bike_paths_clean"
-STATIONS_CSV = "processed/analysis_output.csv"
+
+OSM_CACHE_DIR = os.path.join("processed", "osm_cache")
+OSM_TILE_DEG = 0.05
+OSM_WORKERS = 4
+CYCLELIKE_HIGHWAYS = ("cycleway", "path", "residential", "service", "primary", "secondary", "tertiary", "unclassified", "track")
+OSM_TAG_COLUMNS = ["highway", "cycleway", "bicycle"]
+# tylko drogi, które filtr może uznać za rowerowe, zamiast wszystkich highway=*
+OSM_TAGS = {"highway": list(CYCLELIKE_HIGHWAYS), "cycleway": True}
+
+# "--osm-file=<plik .osm.pbf lub .geojson>": lokalny wycinek OSM zamiast pobierania z Overpass
+OSM_FILE = next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--osm-file=")), None)
 
 def bbox_from_stations(df, pad_meters=2000):
     min_lat, max_lat = df["lat"].min(), df["lat"].max()
@@ -30,67 +48,199 @@ def bbox_from_stations(df, pad_meters=2000):
     east = max_lon + deg_lon
     return north, south, east, west
 
-def fetch_and_store_osm_paths(df_stations, db_file=DB_FILE, table_name=TABLE_PATHS):
-    import osmnx as ox
+def bbox_tiles(north, south, east, west, tile_deg=OSM_TILE_DEG):
+    """Kafelki (west, south, east, north) pokrywające bbox, wyrównane do siatki tile_deg –
+    przy lekko innym zasięgu stacji kolejne przebiegi trafiają w te same pliki cache"""
+    xs = range(math.floor(west / tile_deg), math.ceil(east / tile_deg))
+    ys = range(math.floor(south / tile_deg), math.ceil(north / tile_deg))
+    return [
+        (round(x * tile_deg, 6), round(y * tile_deg, 6), round((x + 1) * tile_deg, 6), round((y + 1) * tile_deg, 6))
+        for x in xs
+        for y in ys
+    ]
+
+
+def osm_tag_frame(gdf):
+    """Tylko kolumny tagów używane przez filtr (jako tekst), identyfikator obiektu OSM i geometria w EPSG:4326"""
     import geopandas as gpd
 
-    n, s, e, w = bbox_from_stations(df_stations)
-    print(f"[INFO] Pobieram OSM w bbox: north={n}, south={s}, east={e}, west={w}")
+    if "osm_id" in gdf.columns:
+        osm_id = gdf["osm_id"].astype(str)
+    else:
+        osm_id = pd.Series(["/".join(map(str, k)) if isinstance(k, tuple) else str(k) for k in gdf.index], index=gdf.index)
+    columns = {"osm_id": osm_id.to_numpy()}
+    for tag in OSM_TAG_COLUMNS:
+        values = gdf[tag] if tag in gdf.columns else pd.Series(None, index=gdf.index, dtype=object)
+        columns[tag] = values.where(values.isna(), values.astype(str)).astype("string").to_numpy()
+    geometry = gdf.geometry if len(gdf) else gpd.GeoSeries([], crs="EPSG:4326")
+    if geometry.crs is None:
+        geometry = geometry.set_crs("EPSG:4326")
+    return gpd.GeoDataFrame(columns, geometry=geometry.to_crs("EPSG:4326").to_numpy(), crs="EPSG:4326")
+
+
+def fetch_osm_tile(bbox, cache_dir=OSM_CACHE_DIR):
+    """Obiekty OSM z jednego kafelka; odpowiedź zapisywana jako GeoParquet i przy kolejnych wywołaniach czytana z dysku"""
+    import geopandas as gpd
+
+    tags_key = hashlib.md5(json.dumps(OSM_TAGS, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    path = os.path.join(cache_dir, tags_key, "{:.4f}_{:.4f}_{:.4f}_{:.4f}.parquet".format(*bbox))
+    if os.path.exists(path):
+        return gpd.read_parquet(path)
+
+    import osmnx as ox
+    from osmnx._errors import InsufficientResponseError
 
-    tags = {"highway": True, "cycleway": True}
-    bbox = (w, s, e, n)
     try:
-        gdf = ox.features_from_bbox(bbox, tags)
-    except Exception as e:
-        print("[ERROR] Błąd pobierania OSM przez osmnx:", e)
-        raise
+        gdf = ox.features_from_bbox(bbox, OSM_TAGS)
+    except InsufficientResponseError:
+        gdf = gpd.GeoDataFrame(geometry=gpd.GeoSeries([], crs="EPSG:4326"))
+    gdf = osm_tag_frame(gdf)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    gdf.to_parquet(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return gdf
+
+
+def fetch_osm_tiles(north, south, east, west, cache_dir=OSM_CACHE_DIR, workers=OSM_WORKERS):
+    """Pobiera bbox kafelkami równolegle; obiekty przecinające granice kafelków są deduplikowane po id OSM"""
+    tiles = bbox_tiles(north, south, east, west)
+    print(f"[INFO] Kafelki OSM: {len(tiles)} (cache: {cache_dir})")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(lambda bbox: fetch_osm_tile(bbox, cache_dir), tiles))
+    gdf = pd.concat(parts, ignore_index=True)
+    return gdf.drop_duplicates(subset=["osm_id"]).reset_index(drop=True)
+
 
-    if gdf is None or gdf.empty:
+def read_osm_extract(path, bbox):
+    """Lokalny wycinek OSM: .osm.pbf (warstwa lines sterownika OSM GDAL) albo GeoJSON z kolumnami tagów"""
+    import geopandas as gpd
+
+    if path.endswith(".pbf"):
+        gdf = gpd.read_file(path, layer="lines", bbox=bbox)
+        # tagi spoza podstawowego schematu sterownik zapisuje w other_tags jako "klucz"=>"wartość"
+        other_tags = gdf["other_tags"].astype("string") if "other_tags" in gdf.columns else pd.Series(pd.NA, index=gdf.index, dtype="string")
+        for tag in OSM_TAG_COLUMNS:
+            if tag not in gdf.columns:
+                gdf[tag] = other_tags.str.extract(f'"{tag}"=>"([^"]*)"', expand=False)
+        if "osm_id" in gdf.columns:
+            gdf["osm_id"] = "way/" + gdf["osm_id"].astype(str)
+    else:
+        gdf = gpd.read_file(path, bbox=bbox)
+    return osm_tag_frame(gdf)
+
+
+def cyclelike_mask(gdf):
+    """Wektorowa wersja dawnego filtra wierszowego: cycleway=* albo droga z CYCLELIKE_HIGHWAYS bez bicycle=no"""
+    not_forbidden = (gdf["bicycle"].str.lower() != "no").fillna(True)
+    return gdf["cycleway"].notna() | (gdf["highway"].isin(CYCLELIKE_HIGHWAYS) & not_forbidden)
+
+
+def fetch_and_store_osm_paths(df_stations, db_file=DB_FILE, table_name=TABLE_PATHS, source=OSM_FILE):
+    n, s, e, w = bbox_from_stations(df_stations)
+    if source:
+        print(f"[INFO] Czytam lokalny wycinek OSM {source} w bbox: north={n}, south={s}, east={e}, west={w}")
+        gdf = read_osm_extract(source, (w, s, e, n))
+    else:
+        print(f"[INFO] Pobieram OSM w bbox: north={n}, south={s}, east={e}, west={w}")
+        try:
+            gdf = fetch_osm_tiles(n, s, e, w)
+        except Exception as e:
+            print("[ERROR] Błąd pobierania OSM przez osmnx:", e)
+            raise
+
+    if gdf.empty:
         print("[WARN] Nie pobrano żadnych obiektów OSM w bbox.")
-        gdf = gpd.GeoDataFrame(columns=["geometry"])
-
-    def is_cyclelike(row):
-        if "cycleway" in row and pd.notna(row["cycleway"]):
-            return True
-        hw = row.get("highway")
-        if hw in ("cycleway", "path", "residential", "service", "primary", "secondary", "tertiary", "unclassified", "track"):
-            if "bicycle" in row and pd.notna(row["bicycle"]):
-                if str(row["bicycle"]).lower() in ("yes", "designated", "permissive"):
-                    return True
-                if str(row["bicycle"]).lower() == "no":
-                    return False
-            return True
-        return False
 
-    gdf["is_cyclelike"] = gdf.apply(lambda r: is_cyclelike(r), axis=1)
-    candidates = gdf[gdf["is_cyclelike"] & gdf.geometry.notna()].copy()
+    candidates = gdf[cyclelike_mask(gdf).to_numpy() & gdf.geometry.notna().to_numpy()].copy()
     candidates = candidates[candidates.geometry.geom_type.isin(["LineString", "MultiLineString", "GeometryCollection"])]
     candidates = candidates.explode(ignore_index=True)
     candidates = candidates.to_crs(epsg=4326)
-    candidates["wkt"] = candidates.geometry.apply(lambda g: g.wkt)
-
-    out_df = pd.DataFrame({"id": range(1, len(candidates)+1), "geom": candidates["wkt"].values})
+    out_df = pd.DataFrame({"id": range(1, len(candidates)+1), "geom": candidates.geometry.to_wkb().values})
     if out_df.empty:
         print("[WARN] Brak candidate geometries po filtrowaniu.")
     else:
         print(f"[INFO] Przygotowano {len(out_df)} ścieżek do zapisu do DuckDB.")
 
+    from nearest_paths import path_table_query
+
+    # WKB z geopandas → GEOMETRY z bbox i kopią metryczną, bez tekstu WKT
     con = duckdb.connect(db_file)
+    con.execute("LOAD spatial;")
     con.execute(f"DROP TABLE IF EXISTS {table_name};")
     con.register("tmp_paths_df", out_df)
-    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM tmp_paths_df;")
+    con.execute(f"CREATE TABLE {table_name} AS {path_table_query('tmp_paths_df', 'ST_GeomFromWKB(geom)')};")
     con.unregister("tmp_paths_df")
+
+    from path_repair import repair_paths, report
+
+    report(*repair_paths(con, table_name))
+
+    from path_segments import TABLE_SEGMENTS, build_segments
+
+    n_segments = build_segments(con, source=table_name)
     con.close()
-    print(f"[OK] Zapisano {len(out_df)} geometrii do tabeli {table_name} w {db_file}")
+    print(f"[OK] Zapisano {len(out_df)} geometrii do tabeli {table_name} w {db_file} ({n_segments} odcinków w {TABLE_SEGMENTS})")
     return len(out_df)
 
-def recompute_distances_with_db_paths(db_file=DB_FILE, table_paths=TABLE_PATHS, stations_csv=STATIONS_CSV, output_csv=STATIONS_CSV):
+def project_to_metric(lon, lat, geoms):
+    """Rzutuje jednorazowo stacje (lon/lat) i geometrie z EPSG:4326 do METRIC_CRS – tego samego układu,
+    w którym preprocess zapisuje kopię metryczną ścieżek."""
+    import numpy as np
+    import shapely
+    from pyproj import Transformer
+    from nearest_paths import METRIC_CRS, project_lonlat
+
+    transformer = Transformer.from_crs("EPSG:4326", METRIC_CRS, always_xy=True)
+
+    def transform_coords(coords):
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        return np.column_stack([x, y])
+
+    x, y = project_lonlat(lon, lat)
+    return x, y, shapely.transform(geoms, transform_coords)
+
+
+def vectorized_min_distances(df, path_ids, geometries):
+    """Minimalne odległości [m] dla wszystkich stacji naraz: rzutowanie metryczne + STRtree."""
+    import numpy as np
+    from nearest_paths import PathIndex
+
+    if df.empty:
+        return np.empty(0)
+    x, y, metric_geoms = project_to_metric(df["lon"], df["lat"], geometries)
+
+    _, dist = PathIndex(path_ids, metric_geoms).nearest(x, y, k=1)
+    return dist[:, 0]
+
+
+def loop_min_distances(df, geometries):
+    """Dawna pętla stacje × ścieżki w stopniach przeliczanych na metry (tylko do porównań)."""
+    from shapely.geometry import Point
+
+    out = []
+    for _, row in df.iterrows():
+        point = Point(row["lon"], row["lat"])
+        min_dist = float("inf")
+        for geom in geometries:
+            dist_deg = point.distance(geom)
+            dist_m = dist_deg * 111320
+            if dist_m < min_dist:
+                min_dist = dist_m
+        out.append(min_dist)
+    return out
+
+
+def recompute_distances_with_db_paths(db_file=DB_FILE, table_paths=TABLE_PATHS, snapshot_date=None, mode="vectorized"):
+    import time
     import duckdb
+    import numpy as np
     import pandas as pd
-    from shapely import wkt
-    from shapely.geometry import Point, LineString, MultiLineString
+    import shapely
 
-    df = pd.read_csv(stations_csv)
+    if snapshot_date is None:
+        snapshot_date = latest_snapshot_date()
+    df = read_analysis_output(columns=["station_id", "name", "lat", "lon"], snapshot_date=snapshot_date)
     df["lat"] = df["lat"].astype(float)
     df["lon"] = df["lon"].astype(float)
 
@@ -100,50 +250,61 @@ def recompute_distances_with_db_paths(db_file=DB_FILE, table_paths=TABLE_PATHS,
         print(f"[ERROR] Tabela {table_paths} nie istnieje w DB.")
         return False
 
-    rows = con.execute(f"SELECT geom FROM {table_paths}").fetchall()
-    geometries = []
-    for (geom_wkt,) in rows:
-        try:
-            g = wkt.loads(geom_wkt)
-            if isinstance(g, (LineString, MultiLineString)):
-                geometries.append(g)
-        except Exception:
-            continue
-
-    if not geometries:
-        print("[WARN] Brak poprawnych geometrii do wyliczeń.")
-        return False
+    from nearest_paths import METRIC_GEOM_COL, column_type, geometry_as_wkt, nearest_path_distances
 
-    print(f"[INFO] Liczymy minimalne odległości dla {len(df)} stacji i {len(geometries)} ścieżek...")
+    # tabela z kopią metryczną i bbox: kandydaci wybierani po kolumnach bbox, bez parsowania WKT
+    use_metric_copy = mode == "vectorized" and column_type(con, table_paths, METRIC_GEOM_COL) is not None
+    if use_metric_copy:
+        print(f"[INFO] Liczymy minimalne odległości dla {len(df)} stacji z kopii metrycznej {table_paths}...")
+    else:
+        rows = con.execute(f"SELECT id, {geometry_as_wkt(con, table_paths)} AS geom FROM {table_paths}").fetchdf()
+        parsed = shapely.from_wkt(rows["geom"].to_numpy(dtype=object), on_invalid="ignore")
+        is_line = np.isin(shapely.get_type_id(parsed), [1, 5])
+        path_ids = rows["id"].to_numpy(dtype=object)[is_line]
+        geometries = parsed[is_line]
 
-    out = []
-    for idx, row in df.iterrows():
-        point = Point(row["lon"], row["lat"])
-        min_dist = float("inf")
-        for geom in geometries:
-            dist_deg = point.distance(geom)
-            dist_m = dist_deg * 111320
-            if dist_m < min_dist:
-                min_dist = dist_m
-        out.append({
-            "station_id": row["station_id"],
-            "name": row.get("name", ""),
-            "lat": row["lat"],
-            "lon": row["lon"],
-            "min_distance_m": min_dist
-        })
-
-    pd.DataFrame(out).to_csv(output_csv, index=False)
-    print(f"[OK] Policzone odległości i zapisano do {output_csv}")
+        if len(geometries) == 0:
+            print("[WARN] Brak poprawnych geometrii do wyliczeń.")
+            return False
+
+        print(f"[INFO] Liczymy minimalne odległości dla {len(df)} stacji i {len(geometries)} ścieżek (tryb: {mode})...")
+
+    start = time.perf_counter()
+    if use_metric_copy:
+        from path_segments import TABLE_SEGMENTS
+
+        table, id_col = (TABLE_SEGMENTS, "path_id") if column_type(con, TABLE_SEGMENTS, METRIC_GEOM_COL) else (table_paths, "id")
+        min_distances = nearest_path_distances(con, table, df["lon"], df["lat"], id_col=id_col)
+    elif mode == "vectorized":
+        min_distances = vectorized_min_distances(df, path_ids, geometries)
+    elif mode == "loop":
+        min_distances = loop_min_distances(df, geometries)
+    else:
+        raise ValueError(f"Nieznany tryb liczenia odległości: {mode}")
+    elapsed = time.perf_counter() - start
+    print(f"[INFO] Czas: {elapsed:.2f} s, przepustowość: {len(df) / max(elapsed, 1e-9):.0f} stacji/s")
+
+    out = pd.DataFrame({
+        "station_id": df["station_id"],
+        "name": df["name"] if "name" in df.columns else "",
+        "lat": df["lat"],
+        "lon": df["lon"],
+        "min_distance_m": min_distances,
+    })
+
+    write_analysis_output(out, snapshot_date=snapshot_date)
+    print(f"[OK] Policzone odległości i zapisano partycję {snapshot_date}")
     return True
 
 def main():
-    install_check()
-    if not os.path.exists(STATIONS_CSV):
-        print(f"[ERROR] Nie znaleziono pliku stacji: {STATIONS_CSV}. Uruchom analysis.py, by go wygenerować.")
+    install_check(need_osmnx=OSM_FILE is None)
+    try:
+        snapshot_date = latest_snapshot_date()
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
         sys.exit(1)
 
-    df = pd.read_csv(STATIONS_CSV)
+    df = read_analysis_output(columns=["station_id", "name", "lat", "lon"], snapshot_date=snapshot_date)
     if df.empty:
         print("[ERROR] Plik stacji jest pusty.")
         sys.exit(1)
@@ -152,7 +313,7 @@ def main():
     if n == 0:
         print("[WARN] Nie pobrano żadnych ścieżek OSM. Sprawdź bounding box i połączenie internetowe.")
 
-    recompute_distances_with_db_paths()
+    recompute_distances_with_db_paths(snapshot_date=snapshot_date)
 
 if __name__ == "__main__":
     main()
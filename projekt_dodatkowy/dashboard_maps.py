@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import folium
+from folium.plugins import FastMarkerCluster, HeatMap
+
+DEFAULT_CENTER = [52.0, 21.0]
+
+# markery tworzone po stronie przeglądarki z wierszy [lat, lon, popup]
+MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    return marker;
+};
+"""
+
+
+def map_center(df):
+    if df.empty:
+        return DEFAULT_CENTER
+    return [float(df["lat"].mean()), float(df["lon"].mean())]
+
+
+def heat_data(df):
+    """Wiersze [lat, lon, waga] prosto z tablic NumPy kolumn"""
+    return df[["lat", "lon", "availableBikes"]].to_numpy(dtype=float).tolist()
+
+
+def popup_texts(df):
+    distances = np.char.mod("%.2f", df["min_distance_m"].to_numpy(dtype=float))
+    names = df["name"] if "name" in df.columns else pd.Series("-", index=df.index)
+    return (
+        "Stacja: " + names.fillna("-").astype(str).to_numpy(dtype=object)
+        + "<br>Rowery: " + df["availableBikes"].astype(str).to_numpy(dtype=object)
+        + "<br>Odległość od ścieżki: " + distances.astype(object) + " m"
+    )
+
+
+def build_heat_map(df, center):
+    m = folium.Map(location=center, zoom_start=12)
+    if not df.empty:
+        HeatMap(heat_data(df)).add_to(m)
+    return m
+
+
+def build_cluster_map(df, center):
+    m = folium.Map(location=center, zoom_start=12)
+    if not df.empty:
+        rows = list(zip(df["lat"].tolist(), df["lon"].tolist(), popup_texts(df).tolist()))
+        FastMarkerCluster(rows, callback=MARKER_CALLBACK).add_to(m)
+    return m
+
+
+def build_frame_map(frame, center):
+    """Heatmapa jednej klatki kostki godzinowej (wiersze [lat, lon, waga])"""
+    m = folium.Map(location=center, zoom_start=12)
+    if len(frame):
+        HeatMap(frame.tolist()).add_to(m)
+    return m
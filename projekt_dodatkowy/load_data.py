@@ -2,9 +2,20 @@ import duckdb
 import geopandas as gpd
 import pandas as pd
 import os
+import sys
 import json
 
-DB_PATH = "spatial_duck.db"
+from pipeline_metrics import stage_metrics
+from utils import DB_PATH
+
+# "--pandas": dawny tryb przez pandas/geopandas, geometrie zapisywane jako tekst WKT
+NATIVE_LOADERS = "--pandas" not in sys.argv
+
+# jawne schematy {kolumna: typ DuckDB}; None = typy wykrywane z całego pliku, a nie z próbki
+BIKE_PATHS_COLUMNS = None
+WEATHER_COLUMNS = None
+
+GEOMETRY_COLUMNS = ("geometry", "geom")
 
 
 def load_geojson_as_df(path):
@@ -32,8 +43,115 @@ def load_json(path):
 def load_csv(path):
     return pd.read_csv(path)
 
+def sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def columns_option(columns):
+    """Opcja columns={...} dla read_json/read_csv albo wykrywanie typów z całego pliku"""
+    if columns is None:
+        return "sample_size=-1"
+    schema = ", ".join(f"{sql_literal(name)}: {sql_literal(dtype)}" for name, dtype in columns.items())
+    return f"columns={{{schema}}}"
+
+
+def json_records_query(con, path, columns=None):
+    """Zapytanie read_json zwracające rekordy – z tablicy JSON albo, jak load_json,
+    z listy pod pierwszym kluczem obiektu"""
+    with open(path, "rb") as f:
+        head = f.read(4096).lstrip(b"\xef\xbb\xbf \t\r\n")
+
+    if head.startswith(b"["):
+        return f"SELECT * FROM read_json({sql_literal(path)}, format='array', {columns_option(columns)})"
+
+    if head.startswith(b"{"):
+        source = f"read_json({sql_literal(path)}, format='unstructured', sample_size=-1)"
+        first_key = con.execute(f"DESCRIBE SELECT * FROM {source}").fetchone()[0]
+        records = f'SELECT r.* FROM (SELECT UNNEST("{first_key}") AS r FROM {source})'
+        if columns is None:
+            return records
+        casts = ", ".join(f'"{name}"::{dtype} AS "{name}"' for name, dtype in columns.items())
+        return f"SELECT {casts} FROM ({records})"
+
+    raise ValueError("Nieznany format JSON")
+
+
+def with_native_geometry(con, query):
+    """Kolumny geometrii zapisane jako WKT albo obiekty GeoJSON zamieniane na GEOMETRY"""
+    types = {row[0]: row[1] for row in con.execute(f"DESCRIBE {query}").fetchall()}
+    replace = []
+    for col in GEOMETRY_COLUMNS:
+        dtype = types.get(col)
+        if dtype == "VARCHAR":
+            replace.append(f'ST_GeomFromText(NULLIF(trim("{col}"), \'\')) AS "{col}"')
+        elif dtype is not None and (dtype.startswith("STRUCT") or dtype == "JSON"):
+            replace.append(f'ST_GeomFromGeoJSON(to_json("{col}")) AS "{col}"')
+    if not replace:
+        return query
+    return f"SELECT * REPLACE ({', '.join(replace)}) FROM ({query})"
+
+
+def load_bike_paths(con, path="bike_paths.json", native=NATIVE_LOADERS):
+    if not os.path.exists(path):
+        return False
+    with stage_metrics("load_bike_paths", con) as m:
+        con.execute("DROP TABLE IF EXISTS bike_paths;")
+
+        if native:
+            con.execute("LOAD spatial;")
+            query = with_native_geometry(con, json_records_query(con, path, BIKE_PATHS_COLUMNS))
+            m.rows_out = m.execute(f"CREATE TABLE bike_paths AS {query};")[0][0]
+        else:
+            df_paths = load_json(path)
+            con.register("df_paths", df_paths)
+            m.rows_out = m.execute("CREATE TABLE bike_paths AS SELECT * FROM df_paths;")[0][0]
+    print("Załadowano bike_paths.json")
+    return True
+
+
+def load_bike_stations(con, path="bike_stations_with_attributes.geojson", native=NATIVE_LOADERS):
+    if not os.path.exists(path):
+        return False
+    with stage_metrics("load_bike_stations", con) as m:
+        con.execute("DROP TABLE IF EXISTS bike_stations;")
+
+        if native:
+            # ST_Read (GDAL) zwraca geometrię jako kolumnę geom typu GEOMETRY
+            con.execute("LOAD spatial;")
+            m.rows_out = m.execute(f"""
+            CREATE TABLE bike_stations AS
+            SELECT * EXCLUDE (geom), geom AS geometry
+            FROM ST_Read({sql_literal(path)});
+            """)[0][0]
+        else:
+            gdf_stations = load_geojson_as_df(path)
+            con.register("gdf_stations", gdf_stations)
+            m.rows_out = m.execute("CREATE TABLE bike_stations AS SELECT * FROM gdf_stations;")[0][0]
+    print("Załadowano stacje rowerowe")
+    return True
+
+
+def load_weather(con, path="weather_data.csv", native=NATIVE_LOADERS):
+    if not os.path.exists(path):
+        return False
+    with stage_metrics("load_weather", con) as m:
+        con.execute("DROP TABLE IF EXISTS weather;")
+
+        if native:
+            m.rows_out = m.execute(f"""
+            CREATE TABLE weather AS
+            SELECT * FROM read_csv({sql_literal(path)}, header=true, {columns_option(WEATHER_COLUMNS)});
+            """)[0][0]
+        else:
+            df_weather = load_csv(path)
+            con.register("df_weather", df_weather)
+            m.rows_out = m.execute("CREATE TABLE weather AS SELECT * FROM df_weather;")[0][0]
+    print("Załadowano dane pogodowe")
+    return True
+
+
 def main():
-    con = duckdb.connect(DB_PATH)
+    con = duckdb.connect(str(DB_PATH))
     
     
     con.execute("INSTALL spatial;")
@@ -41,30 +159,9 @@ def main():
 
     print("Ładowanie danych...")
 
-    
-    if os.path.exists("bike_paths.json"):
-        con.execute("DROP TABLE IF EXISTS bike_paths;")
-        
-        df_paths = load_json("bike_paths.json")
-        con.register("df_paths", df_paths)
-        con.execute("CREATE TABLE bike_paths AS SELECT * FROM df_paths;")
-        print("Załadowano bike_paths.json")
-
-    if os.path.exists("bike_stations_with_attributes.geojson"):
-        con.execute("DROP TABLE IF EXISTS bike_stations;")
-        
-        gdf_stations = load_geojson_as_df("bike_stations_with_attributes.geojson")
-        con.register("gdf_stations", gdf_stations)
-        con.execute("CREATE TABLE bike_stations AS SELECT * FROM gdf_stations;")
-        print("Załadowano stacje rowerowe")
-
-    if os.path.exists("weather_data.csv"):
-        con.execute("DROP TABLE IF EXISTS weather;")
-        
-        df_weather = load_csv("weather_data.csv")
-        con.register("df_weather", df_weather)
-        con.execute("CREATE TABLE weather AS SELECT * FROM df_weather;")
-        print("Załadowano dane pogodowe")
+    load_bike_paths(con)
+    load_bike_stations(con)
+    load_weather(con)
 
     print("Wszystkie dane zostały załadowane do DuckDB!")
 
@@ -0,0 +1,107 @@
+import sys
+
+import duckdb
+import numpy as np
+import pandas as pd
+import shapely
+
+from nearest_paths import METRIC_CRS, METRIC_GEOM_COL, column_type, path_table_query, project_lonlat, read_geometries
+from utils import DB_PATH
+
+TABLE_PATHS = "bike_paths_clean"
+TABLE_SEGMENTS = "bike_path_segments"
+SEGMENT_MAX_M = 200.0
+# "--simplify=<metry>": uproszczenie geometrii z tolerancją w metrach przed podziałem (domyślnie bez)
+SIMPLIFY_TOLERANCE_M = next((float(a.split("=", 1)[1]) for a in sys.argv if a.startswith("--simplify=")), None)
+
+
+def split_lines(path_ids, geoms, max_length=SEGMENT_MAX_M, tolerance=None):
+    """Dzieli linie (w układzie metrycznym) na odcinki nie dłuższe niż max_length.
+
+    Krawędzie są najpierw zagęszczane do max_length / 4, a potem grupowane po długości
+    od początku linii w kawałki po 3/4 max_length – kawałek z ostatnią krawędzią mieści się w limicie.
+    Zwraca (path_ids, odcinki) – każdy odcinek zachowuje id ścieżki, z której powstał.
+    """
+    parts, part_idx = shapely.get_parts(np.asarray(geoms, dtype=object), return_index=True)
+    lines = np.isin(shapely.get_type_id(parts), [1, 2])
+    parts, part_idx = parts[lines], part_idx[lines]
+    if tolerance:
+        parts = shapely.simplify(parts, tolerance, preserve_topology=False)
+    # linie zerowej długości (także małe zamknięte drogi zwinięte przez simplify) nie dają odcinków,
+    # a segmentize zgłasza błąd dla linii zdegenerowanej do jednego punktu
+    nonzero = shapely.length(parts) > 0
+    parts, part_idx = parts[nonzero], part_idx[nonzero]
+    parts = shapely.segmentize(parts, max_length / 4.0)
+    if len(parts) == 0:
+        return np.empty(0, dtype=object), np.empty(0, dtype=object)
+
+    coords, line = shapely.get_coordinates(parts, return_index=True)
+    same_line = line[1:] == line[:-1]
+    edge_len = np.where(same_line, np.hypot(*(coords[1:] - coords[:-1]).T), 0.0)
+
+    # długość od początku linii w każdym wierzchołku
+    cum = np.concatenate([[0.0], np.cumsum(edge_len)])
+    line_start = np.concatenate([[True], ~same_line])
+    cum -= np.maximum.accumulate(np.where(line_start, cum, 0.0))
+
+    # krawędź i (wierzchołek i → i+1) należy do kawałka wyznaczonego przez długość w jej początku
+    chunk = np.floor(cum[:-1] / (0.75 * max_length)).astype(np.int64)
+    edges = np.flatnonzero(same_line)
+    edge_piece = np.zeros(len(edges), dtype=np.int64)
+    if len(edges):
+        new_piece = np.concatenate([[True], (line[edges[1:]] != line[edges[:-1]]) | (chunk[edges[1:]] != chunk[edges[:-1]])])
+        edge_piece = np.cumsum(new_piece) - 1
+
+    # wierzchołki kawałka: początki jego krawędzi i koniec ostatniej krawędzi
+    last_edge = np.concatenate([edge_piece[1:] != edge_piece[:-1], [True]]) if len(edges) else np.empty(0, dtype=bool)
+    vertex_idx = np.concatenate([edges, edges[last_edge] + 1])
+    vertex_piece = np.concatenate([edge_piece, edge_piece[last_edge]])
+    order = np.lexsort((vertex_idx, vertex_piece))
+    pieces = shapely.linestrings(coords[vertex_idx[order]], indices=vertex_piece[order])
+
+    piece_line = line[edges[np.concatenate([[True], edge_piece[1:] != edge_piece[:-1]])]] if len(edges) else line[:0]
+    ids = np.asarray(path_ids, dtype=object)[part_idx[piece_line]]
+    return ids, pieces
+
+
+def build_segments(con, source=TABLE_PATHS, table=TABLE_SEGMENTS, max_length=SEGMENT_MAX_M, tolerance=SIMPLIFY_TOLERANCE_M):
+    """Zapisuje tabelę odcinków ścieżek (układ jak w path_table_query + path_id ścieżki źródłowej).
+
+    Podział i upraszczanie liczone są na kopii metrycznej (albo geometrii rzutowanej, gdy jej brak).
+    Zwraca liczbę odcinków.
+    """
+    if column_type(con, source, METRIC_GEOM_COL):
+        path_ids, geoms = read_geometries(con, source, geom_col=METRIC_GEOM_COL)
+    else:
+        path_ids, geoms = read_geometries(con, source)
+        geoms = shapely.transform(geoms, lambda xy: np.column_stack(project_lonlat(xy[:, 0], xy[:, 1])))
+
+    ids, pieces = split_lines(path_ids, geoms, max_length, tolerance)
+
+    from pyproj import Transformer
+
+    to_lonlat = Transformer.from_crs(METRIC_CRS, "EPSG:4326", always_xy=True)
+    pieces = shapely.transform(pieces, lambda xy: np.column_stack(to_lonlat.transform(xy[:, 0], xy[:, 1])))
+    segments = pd.DataFrame({
+        "id": np.arange(1, len(pieces) + 1),
+        "path_id": ids,
+        "geom": shapely.to_wkb(pieces),
+    })
+
+    con.execute("LOAD spatial;")
+    con.register("tmp_segments_df", segments)
+    con.execute(f"CREATE OR REPLACE TABLE {table} AS {path_table_query('tmp_segments_df', 'ST_GeomFromWKB(geom)')};")
+    con.unregister("tmp_segments_df")
+    return len(segments)
+
+
+def main():
+    con = duckdb.connect(str(DB_PATH))
+    n = build_segments(con)
+    tolerance = f", uproszczenie {SIMPLIFY_TOLERANCE_M} m" if SIMPLIFY_TOLERANCE_M else ""
+    print(f"[OK] Tabela {TABLE_SEGMENTS}: {n} odcinków (maks. {SEGMENT_MAX_M:.0f} m{tolerance})")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+from contextlib import contextmanager
+
+import duckdb
+import pandas as pd
+
+from utils import DB_PATH
+
+METRICS_TABLE = "pipeline_metrics"
+# wspólny identyfikator przebiegu dla etapów uruchomionych z pipeline.py w jednym procesie
+RUN_ID_ENV = "PIPELINE_RUN_ID"
+TOP_OPERATORS = 5
+WRITE_STATEMENTS = ("CREATE", "INSERT", "UPDATE", "DELETE")
+OPERATORS_SCHEMA = '[{"operator": "VARCHAR", "timing_s": "DOUBLE", "rows": "BIGINT"}]'
+
+
+def peak_rss_mb():
+    """Szczytowe RSS bieżącego procesu w MB (None, gdy nie da się go odczytać)"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def current_run_id():
+    return os.environ.setdefault(RUN_ID_ENV, datetime.datetime.now().strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}")
+
+
+def create_metrics_table(con):
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {METRICS_TABLE} (
+        run_id VARCHAR,
+        stage VARCHAR,
+        kind VARCHAR,
+        label VARCHAR,
+        started_at TIMESTAMP,
+        wall_s DOUBLE,
+        cpu_s DOUBLE,
+        peak_memory_mb DOUBLE,
+        rows_in BIGINT,
+        rows_out BIGINT,
+        status VARCHAR,
+        profile VARCHAR
+    );
+    """)
+
+
+def top_operators(profile, top=TOP_OPERATORS):
+    """Najwolniejsze operatory z profilu DuckDB (drzewo jak w EXPLAIN ANALYZE)"""
+    operators, todo = [], list(profile.get("children", []))
+    while todo:
+        node = todo.pop()
+        todo.extend(node.get("children", []))
+        operators.append({
+            "operator": node.get("operator_name") or node.get("operator_type"),
+            "timing_s": node.get("operator_timing", 0.0),
+            "rows": node.get("operator_cardinality", 0),
+        })
+    return sorted(operators, key=lambda o: o["timing_s"], reverse=True)[:top]
+
+
+class StageMetrics:
+    """Pomiary jednego etapu: czas, CPU, szczytowa pamięć i liczby wierszy etapu oraz profil
+    każdej instrukcji SQL wykonanej przez execute()/fetchdf() i każdego kroku step().
+
+    Wiersze trafiają do tabeli pipeline_metrics przy finish() – kursorem połączenia etapu con,
+    a bez niego połączeniem z bazą db_path (jedno z nich jest wymagane). CPU etapu to czas procesu –
+    obejmuje wątki DuckDB, ale też etapy uruchomione równolegle w tym samym procesie.
+    """
+
+    def __init__(self, stage, con=None, kind="stage", db_path=None):
+        if con is None and db_path is None:
+            raise ValueError(f"Pomiary etapu {stage}: podaj połączenie con albo db_path")
+        self.stage = stage
+        self.con = con
+        self.db_path = db_path
+        self.kind = kind
+        self.rows_in = None
+        self.rows_out = None
+        self.records = []
+        self.run_id = current_run_id()
+        self.started_at = datetime.datetime.now()
+        self.profile_path = os.path.join(tempfile.gettempdir(), f"duckdb_profile_{os.getpid()}_{id(self)}.json")
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def _run(self, sql, params, label, fetch, con):
+        con = con or self.con
+        if os.path.exists(self.profile_path):
+            os.remove(self.profile_path)
+        con.execute("SET enable_profiling = 'json';")
+        con.execute(f"SET profiling_output = '{self.profile_path}';")
+        started_at, wall = datetime.datetime.now(), time.perf_counter()
+        try:
+            # wynik pobierany od razu – DuckDB zapisuje profil dopiero po zakończeniu zapytania
+            result = fetch(con.execute(sql, params))
+        finally:
+            con.execute("PRAGMA disable_profiling;")
+        wall = time.perf_counter() - wall
+
+        profile = {}
+        if os.path.exists(self.profile_path):
+            with open(self.profile_path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+            os.remove(self.profile_path)
+
+        rows_out = profile.get("rows_returned")
+        if sql.lstrip().upper().startswith(WRITE_STATEMENTS) and isinstance(result, list) and len(result) == 1:
+            rows_out = result[0][0]
+        self.records.append({
+            "kind": "statement",
+            "label": label or " ".join(sql.split())[:120],
+            "started_at": started_at,
+            "wall_s": wall,
+            "cpu_s": profile.get("cpu_time"),
+            "peak_memory_mb": profile["system_peak_buffer_memory"] / 2**20 if "system_peak_buffer_memory" in profile else None,
+            "rows_in": profile.get("cumulative_rows_scanned"),
+            "rows_out": rows_out,
+            "status": "ok",
+            "profile": json.dumps(top_operators(profile)) if profile else None,
+        })
+        return result
+
+    @contextmanager
+    def step(self, label):
+        """Pomiar fragmentu etapu poza SQL (np. liczenie odległości w Pythonie)"""
+        started_at, wall, cpu = datetime.datetime.now(), time.perf_counter(), time.process_time()
+        status = "failed"
+        try:
+            yield
+            status = "ok"
+        finally:
+            self.records.append({
+                "kind": "step",
+                "label": label,
+                "started_at": started_at,
+                "wall_s": time.perf_counter() - wall,
+                "cpu_s": time.process_time() - cpu,
+                "peak_memory_mb": peak_rss_mb(),
+                "rows_in": None,
+                "rows_out": None,
+                "status": status,
+                "profile": None,
+            })
+
+    def execute(self, sql, params=None, label=None, con=None):
+        """Wykonuje instrukcję z profilowaniem i zwraca wszystkie wiersze wyniku (fetchall)"""
+        return self._run(sql, params, label, lambda r: r.fetchall(), con)
+
+    def fetchdf(self, sql, params=None, label=None, con=None):
+        return self._run(sql, params, label, lambda r: r.fetchdf(), con)
+
+    def finish(self, status="ok"):
+        """Dopisuje wiersz etapu i jego instrukcji do pipeline_metrics.
+
+        Kursor ma własną transakcję, więc zapis nie miesza się z otwartą transakcją etapu.
+        """
+        self.records.insert(0, {
+            "kind": self.kind,
+            "label": self.stage,
+            "started_at": self.started_at,
+            "wall_s": time.perf_counter() - self._wall,
+            "cpu_s": time.process_time() - self._cpu,
+            "peak_memory_mb": peak_rss_mb(),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "status": status,
+            "profile": None,
+        })
+        df = pd.DataFrame(self.records).assign(run_id=self.run_id, stage=self.stage)
+        self.records = []
+        # błąd zapisu pomiarów nie przerywa etapu
+        try:
+            con = self.con.cursor() if self.con is not None else duckdb.connect(str(self.db_path))
+            try:
+                create_metrics_table(con)
+                con.register("metrics_df", df)
+                con.execute(f"INSERT INTO {METRICS_TABLE} BY NAME SELECT * FROM metrics_df;")
+                con.unregister("metrics_df")
+            finally:
+                con.close()
+        except duckdb.Error as e:
+            print(f"[WARN] Nie zapisano pomiarów etapu {self.stage}: {e}")
+
+
+@contextmanager
+def stage_metrics(stage, con=None, kind="stage", db_path=None):
+    """with stage_metrics("etap", con) as m: ... – zapisuje pomiary także wtedy, gdy etap się nie powiedzie"""
+    metrics = StageMetrics(stage, con, kind, db_path)
+    try:
+        yield metrics
+    except BaseException:
+        metrics.finish("failed")
+        raise
+    metrics.finish()
+
+
+def show(title, df):
+    print(f"\n===== {title} =====")
+    print(df.to_string(index=False) if not df.empty else "(brak danych)")
+
+
+def report(con, runs=10, stage=None, top=10, kind="stage"):
+    """Trend czasu etapów w ostatnich przebiegach oraz najwolniejsze instrukcje i operatory ostatniego przebiegu"""
+    stage_filter, params = ("AND stage = ?", [stage]) if stage else ("", [])
+    run_order = con.execute(f"""
+    SELECT run_id FROM {METRICS_TABLE}
+    WHERE kind = ? {stage_filter}
+    GROUP BY run_id ORDER BY MIN(started_at) DESC LIMIT ?
+    """, [kind] + params + [runs]).fetchall()
+    run_ids = [r[0] for r in reversed(run_order)]
+    if not run_ids:
+        print("[INFO] Brak pomiarów w tabeli pipeline_metrics.")
+        return
+
+    trend = con.execute(f"""
+    SELECT stage, run_id, SUM(wall_s) AS wall_s
+    FROM {METRICS_TABLE}
+    WHERE kind = ? AND run_id IN (SELECT unnest(?)) {stage_filter}
+    GROUP BY stage, run_id
+    """, [kind, run_ids] + params).fetchdf()
+    trend = trend.pivot(index="stage", columns="run_id", values="wall_s").reindex(columns=run_ids)
+    if len(run_ids) > 1:
+        previous = trend[run_ids[:-1]].median(axis=1)
+        trend["zmiana"] = ((trend[run_ids[-1]] / previous - 1) * 100).map(lambda v: f"{v:+.0f}%" if pd.notna(v) else "-")
+    show(f"CZAS ETAPÓW [s] – ostatnie {len(run_ids)} przebiegi", trend.round(3).reset_index())
+
+    last = run_ids[-1]
+    show(f"NAJWOLNIEJSZE INSTRUKCJE I KROKI – {last}", con.execute(f"""
+    SELECT stage, kind, round(wall_s, 3) AS wall_s, round(cpu_s, 3) AS cpu_s, round(peak_memory_mb, 1) AS mem_mb,
+           rows_in, rows_out, left(label, 60) AS label
+    FROM {METRICS_TABLE}
+    WHERE run_id = ? AND kind IN ('statement', 'step') {stage_filter}
+    ORDER BY wall_s DESC LIMIT ?
+    """, [last] + params + [top]).fetchdf())
+
+    show(f"NAJWOLNIEJSZE OPERATORY – {last}", con.execute(f"""
+    SELECT stage, op.operator, round(op.timing_s, 3) AS timing_s, op.rows, left(label, 40) AS statement
+    FROM (
+        SELECT stage, label, unnest(from_json(profile, '{OPERATORS_SCHEMA}')) AS op
+        FROM {METRICS_TABLE}
+        WHERE run_id = ? AND kind = 'statement' AND profile IS NOT NULL {stage_filter}
+    )
+    ORDER BY op.timing_s DESC LIMIT ?
+    """, [last] + params + [top]).fetchdf())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raport z pomiarów etapów zapisanych w tabeli pipeline_metrics.")
+    parser.add_argument("--runs", type=int, default=10, help="liczba ostatnich przebiegów w trendzie")
+    parser.add_argument("--stage", help="tylko wybrany etap")
+    parser.add_argument("--top", type=int, default=10, help="liczba najwolniejszych instrukcji i operatorów")
+    parser.add_argument("--kind", default="stage", choices=["stage", "pipeline"],
+                        help="etapy skryptów albo etapy z pipeline.py")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_PATH):
+        print(f"[ERROR] Brak bazy {DB_PATH}.")
+        sys.exit(1)
+    con = duckdb.connect(str(DB_PATH), read_only=True)
+    try:
+        if con.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [METRICS_TABLE]).fetchone()[0] == 0:
+            print("[INFO] Brak tabeli pipeline_metrics — uruchom najpierw etapy pipeline'u.")
+            return
+        report(con, args.runs, args.stage, args.top, args.kind)
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import json
+import datetime
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+PROCESSED_DIR = "processed"
+ANALYSIS_DATASET = os.path.join(PROCESSED_DIR, "analysis_output")
+PARTITION_COLUMN = "snapshot_date"
+
+
+def list_snapshot_dates(dataset_path=ANALYSIS_DATASET):
+    if not os.path.exists(dataset_path):
+        return []
+    prefix = f"{PARTITION_COLUMN}="
+    return sorted(d[len(prefix):] for d in os.listdir(dataset_path) if d.startswith(prefix))
+
+
+def latest_snapshot_date(dataset_path=ANALYSIS_DATASET):
+    dates = list_snapshot_dates(dataset_path)
+    if not dates:
+        raise FileNotFoundError(f"Brak danych w {dataset_path}. Uruchom najpierw analysis.py.")
+    return dates[-1]
+
+
+def geoparquet_metadata(geometry_column="geometry"):
+    """Metadane 'geo' (GeoParquet 1.0) dla kolumny punktów WKB w EPSG:4326"""
+    return {
+        "version": "1.0.0",
+        "primary_column": geometry_column,
+        "columns": {geometry_column: {"encoding": "WKB", "geometry_types": ["Point"]}},
+    }
+
+
+def write_analysis_output(df, snapshot_date=None, dataset_path=ANALYSIS_DATASET):
+    """Zapisuje wynik etapu jako partycję snapshot_date=YYYY-MM-DD (nadpisuje tylko tę partycję).
+
+    snapshot_date to dzień danych, z których policzono wynik (stations_ingest.data_snapshot_date),
+    a nie dzień uruchomienia – bieżąca data jest używana tylko wtedy, gdy go nie podano.
+
+    Jeżeli są kolumny lat/lon, dopisywana jest kolumna geometry (WKB) z metadanymi GeoParquet.
+    Zwraca datę zapisanej partycji.
+    """
+    if snapshot_date is None:
+        snapshot_date = datetime.date.today().isoformat()
+
+    table = pa.Table.from_pandas(df.drop(columns=[PARTITION_COLUMN, "geometry"], errors="ignore"), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    if "lat" in df.columns and "lon" in df.columns:
+        import shapely
+
+        points = shapely.points(df["lon"].to_numpy(dtype=float), df["lat"].to_numpy(dtype=float))
+        table = table.append_column("geometry", pa.array(shapely.to_wkb(points), type=pa.binary()))
+        metadata[b"geo"] = json.dumps(geoparquet_metadata()).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+
+    ds.write_dataset(
+        table,
+        os.path.join(dataset_path, f"{PARTITION_COLUMN}={snapshot_date}"),
+        format="parquet",
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+    )
+    return snapshot_date
+
+
+def read_analysis_output(columns=None, filter=None, snapshot_date=None, dataset_path=ANALYSIS_DATASET):
+    """Czyta partycję (domyślnie najnowszą) z projekcją kolumn i filtrem wypychanym do Parquet.
+
+    Czytany jest tylko katalog partycji, więc schemat pochodzi z niej samej – kolumna dodana
+    w nowszej partycji nie ginie przez schemat najstarszej. Kolumny, których nie ma w danych, są pomijane.
+    """
+    if snapshot_date is None:
+        snapshot_date = latest_snapshot_date(dataset_path)
+    partition_dir = os.path.join(dataset_path, f"{PARTITION_COLUMN}={snapshot_date}")
+    if not os.path.isdir(partition_dir):
+        raise FileNotFoundError(f"Brak partycji {PARTITION_COLUMN}={snapshot_date} w {dataset_path}.")
+
+    dataset = ds.dataset(partition_dir, format="parquet")
+    read_columns = None if columns is None else [c for c in columns if c in dataset.schema.names]
+    table = dataset.to_table(columns=read_columns, filter=filter)
+    if columns is None or PARTITION_COLUMN in columns:
+        table = table.append_column(PARTITION_COLUMN, pa.array([snapshot_date] * len(table), type=pa.string()))
+    return table.to_pandas()
@@ -0,0 +1,120 @@
+import os
+import json
+import shutil
+import datetime
+
+import duckdb
+import numpy as np
+
+from station_tiles import source_version
+from utils import DB_PATH
+
+CUBE_DIR = os.path.join("processed", "cube")
+HOUR_SECONDS = 3600
+
+
+def read_cube_manifest(cube_dir=CUBE_DIR):
+    path = os.path.join(cube_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_cube(con, cube_dir=CUBE_DIR):
+    """Zapisuje kostkę godzina × stacja ze średnią liczbą rowerów (float32, NaN = brak pomiaru)
+    jako avg_bikes.npy, obok współrzędnych stacji i manifestu z pierwszą godziną.
+
+    Godziny tworzą ciągły zakres co 1 h, więc klatka dla danej godziny to jeden wiersz tablicy.
+    Nic nie robi, jeśli kostka odpowiada bieżącej wersji danych. Zwraca True, gdy ją przebudowano.
+    """
+    version = source_version(con)
+    if read_cube_manifest(cube_dir).get("version") == version:
+        return False
+
+    # kolumny kostki to stacje ze współrzędnymi – komórki bez takiej stacji pomijamy, inaczej
+    # searchsorted przypisałby je do sąsiedniej kolumny (albo poza tablicę)
+    con.execute("""
+    CREATE OR REPLACE TEMP TABLE cube_stations AS
+    SELECT station_id, ANY_VALUE(latitude) AS lat, ANY_VALUE(longitude) AS lon
+    FROM stations_snapshots
+    WHERE station_id IS NOT NULL AND latitude IS NOT NULL AND longitude IS NOT NULL
+    GROUP BY station_id
+    """)
+    stations = con.execute("SELECT station_id, lat, lon FROM cube_stations ORDER BY station_id").fetchnumpy()
+    cells = con.execute("""
+    SELECT
+        station_id,
+        epoch(hour)::BIGINT AS hour,
+        sum_available_bikes / NULLIF(count_available_bikes, 0) AS avg_bikes
+    FROM stations_hourly_summary
+    WHERE station_id IN (SELECT station_id FROM cube_stations)
+    """).fetchnumpy()
+    con.execute("DROP TABLE cube_stations")
+
+    station_ids = np.asarray(stations["station_id"], dtype=np.int64)
+    hours = np.asarray(cells["hour"], dtype=np.int64)
+    first_hour = int(hours.min()) if len(hours) else 0
+    n_hours = int((hours.max() - first_hour) // HOUR_SECONDS + 1) if len(hours) else 0
+
+    shutil.rmtree(cube_dir, ignore_errors=True)
+    os.makedirs(cube_dir)
+    values = np.lib.format.open_memmap(
+        os.path.join(cube_dir, "avg_bikes.npy"), mode="w+", dtype=np.float32, shape=(n_hours, len(station_ids))
+    )
+    values[:] = np.nan
+    if len(hours):
+        rows = (hours - first_hour) // HOUR_SECONDS
+        cols = np.searchsorted(station_ids, np.asarray(cells["station_id"], dtype=np.int64))
+        values[rows, cols] = np.asarray(cells["avg_bikes"], dtype=np.float32)
+    values.flush()
+    del values
+
+    np.save(os.path.join(cube_dir, "station_ids.npy"), station_ids)
+    np.save(os.path.join(cube_dir, "coords.npy"), np.column_stack([stations["lat"], stations["lon"]]).astype(np.float64))
+    with open(os.path.join(cube_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": version, "first_hour": first_hour, "n_hours": n_hours}, f)
+    return True
+
+
+class StationCube:
+    """Kostka godzina × stacja otwarta przez mmap – klatka to wycinek jednego wiersza, bez zapytań SQL"""
+
+    def __init__(self, cube_dir=CUBE_DIR):
+        manifest = read_cube_manifest(cube_dir)
+        if not manifest:
+            raise FileNotFoundError(f"Brak kostki w {cube_dir}. Uruchom najpierw station_cube.py.")
+        self.first_hour = manifest["first_hour"]
+        self.n_hours = manifest["n_hours"]
+        self.values = np.load(os.path.join(cube_dir, "avg_bikes.npy"), mmap_mode="r")
+        self.station_ids = np.load(os.path.join(cube_dir, "station_ids.npy"))
+        self.coords = np.load(os.path.join(cube_dir, "coords.npy"))
+
+    def hour_at(self, index):
+        return datetime.datetime.fromtimestamp(self.first_hour + index * HOUR_SECONDS, tz=datetime.timezone.utc)
+
+    def index_of(self, hour):
+        """Indeks klatki dla godziny (datetime; bez strefy traktowany jako UTC), przycięty do zakresu"""
+        if hour.tzinfo is None:
+            hour = hour.replace(tzinfo=datetime.timezone.utc)
+        index = (int(hour.timestamp()) - self.first_hour) // HOUR_SECONDS
+        return max(0, min(self.n_hours - 1, index))
+
+    def frame(self, index):
+        """Wiersze [lat, lon, średnio rowerów] stacji z pomiarem w danej godzinie"""
+        row = np.asarray(self.values[index])
+        mask = ~np.isnan(row)
+        return np.column_stack([self.coords[mask], row[mask]])
+
+
+def main():
+    con = duckdb.connect(str(DB_PATH), read_only=True)
+    if build_cube(con):
+        print(f"[OK] Kostka godzinowa zapisana do: {CUBE_DIR}")
+    else:
+        print("[INFO] Kostka godzinowa aktualna — pomijam budowanie.")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+import os
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+FILES_PER_BATCH = 200
+MANIFEST_TABLE = "snapshot_manifest"
+DIM_TABLE = "stations_dim"
+FACT_TABLE = "stations_fact"
+LATEST_TABLE = "stations_latest"
+ATTRIBUTES_TABLE = "stations_attributes"
+SNAPSHOT_COLUMNS = ["snapshot", "ts", "station_id", "name", "lat", "lon", "available_bikes", "free_places"]
+
+# obsługiwane schematy rekordu: pierwsza obecna (nie-None) wartość z listy wygrywa
+STATION_ID_KEYS = ("uid", "number", "id", "station_id")
+AVAILABLE_BIKES_KEYS = ("availableBikes", "available_bikes", "num_bikes_available")
+FREE_PLACES_KEYS = ("freePlaces", "free_places", "freeRacks", "num_docks_available")
+SNAPSHOT_TS_KEYS = ("timestamp", "last_update", "lastUpdate", "last_updated", "lastUpdated")
+
+
+def list_snapshot_files(folder):
+    """Zwraca posortowaną listę wszystkich plików JSON w folderze (rekurencyjnie), bez limitu"""
+    if not os.path.exists(folder):
+        raise FileNotFoundError(f"Nie znaleziono folderu stacji: {folder}")
+
+    files = []
+    for root, _, names in os.walk(folder):
+        files.extend(os.path.join(root, n) for n in names if n.lower().endswith(".json"))
+    return sorted(files)
+
+
+def first_present(record, keys):
+    return next((record[k] for k in keys if record.get(k) is not None), None)
+
+
+def parse_station(s):
+    """Wyciąga (station_id, name, lat, lon, available_bikes, free_places) z rekordu stacji
+    o dowolnym z obsługiwanych schematów"""
+    station_id = first_present(s, STATION_ID_KEYS)
+    if station_id is None:
+        return None
+
+    coords = s.get("geoCoords") or {}
+    status = s.get("availabilityStatus") or {}
+    available_bikes = first_present(status, AVAILABLE_BIKES_KEYS)
+    if available_bikes is None:
+        available_bikes = first_present(s, AVAILABLE_BIKES_KEYS)
+    free_places = first_present(status, FREE_PLACES_KEYS)
+    if free_places is None:
+        free_places = first_present(s, FREE_PLACES_KEYS)
+    return (
+        str(station_id),
+        s.get("name"),
+        coords.get("lat") if coords.get("lat") is not None else s.get("lat"),
+        coords.get("lng") if coords.get("lng") is not None else s.get("lon"),
+        int(available_bikes or 0),
+        None if free_places is None else int(free_places),
+    )
+
+
+def snapshot_timestamp(data, path):
+    """Czas snapshotu (UTC, bez strefy) z pola nagłówka pliku; gdy go brak – czas modyfikacji pliku"""
+    value = first_present(data, SNAPSHOT_TS_KEYS)
+    try:
+        if isinstance(value, (int, float)):
+            # epoka w sekundach albo milisekundach
+            ts = pd.Timestamp(value, unit="ms" if value > 1e11 else "s", tz="UTC")
+        elif value is not None:
+            ts = pd.Timestamp(value)
+            ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+        else:
+            raise ValueError
+    except (ValueError, TypeError, OverflowError):
+        ts = pd.Timestamp(os.path.getmtime(path), unit="s", tz="UTC")
+    return ts.tz_localize(None)
+
+
+def parse_snapshot_files(paths):
+    """Parsuje paczkę plików w jednym procesie i zwraca kolumnowy DataFrame"""
+    rows = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(data, dict):
+            continue
+
+        stations_list = data.get("stations_data") or data.get("stations") or data.get("station_data") or []
+        ts = snapshot_timestamp(data, path)
+        for s in stations_list:
+            parsed = parse_station(s)
+            if parsed is not None:
+                rows.append((path, ts) + parsed)
+
+    df = pd.DataFrame(rows, columns=SNAPSHOT_COLUMNS)
+    df["ts"] = pd.to_datetime(df["ts"])
+    df["lat"] = df["lat"].astype(float)
+    df["lon"] = df["lon"].astype(float)
+    df["available_bikes"] = df["available_bikes"].astype("int64")
+    df["free_places"] = df["free_places"].astype("Int64")
+    return df
+
+
+def iter_snapshot_batches(files, files_per_batch=FILES_PER_BATCH, workers=None):
+    """Generator paczek (DataFrame) parsowanych równolegle w puli procesów, w kolejności plików.
+
+    W locie jest najwyżej 2 × workers paczek – kolejna trafia do puli dopiero po oddaniu wyniku,
+    więc przy wolniejszym zapisie do DuckDB sparsowane paczki nie gromadzą się w pamięci.
+    """
+    chunks = [files[i:i + files_per_batch] for i in range(0, len(files), files_per_batch)]
+    if len(chunks) <= 1 or workers == 1:
+        for chunk in chunks:
+            yield parse_snapshot_files(chunk)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    window = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque(pool.submit(parse_snapshot_files, chunk) for chunk in chunks[:window])
+        for chunk in chunks[window:]:
+            yield in_flight.popleft().result()
+            in_flight.append(pool.submit(parse_snapshot_files, chunk))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def create_station_tables(con, dim_table=DIM_TABLE, fact_table=FACT_TABLE, latest_table=LATEST_TABLE, replace=False,
+                          attributes_table=ATTRIBUTES_TABLE):
+    """Wymiar stacji (wersje atrybutów, valid_to NULL = wersja bieżąca), wąska tabela faktów,
+    najnowszy stan każdej stacji (jeden wiersz na station_id) i atrybuty stacji z każdego snapshotu,
+    z których przeliczany jest wymiar"""
+    create = "CREATE OR REPLACE TABLE" if replace else "CREATE TABLE IF NOT EXISTS"
+    con.execute(f"""
+    {create} {dim_table} (
+        station_id VARCHAR,
+        name VARCHAR,
+        lat DOUBLE,
+        lon DOUBLE,
+        valid_from TIMESTAMP,
+        valid_to TIMESTAMP
+    )
+    """)
+    con.execute(f"""
+    {create} {fact_table} (
+        station_id VARCHAR,
+        ts TIMESTAMP,
+        bikes INTEGER,
+        free_places INTEGER
+    )
+    """)
+    con.execute(f"""
+    {create} {latest_table} (
+        station_id VARCHAR PRIMARY KEY,
+        ts TIMESTAMP,
+        bikes INTEGER,
+        free_places INTEGER
+    )
+    """)
+    con.execute(f"""
+    {create} {attributes_table} (
+        station_id VARCHAR,
+        ts TIMESTAMP,
+        name VARCHAR,
+        lat DOUBLE,
+        lon DOUBLE
+    )
+    """)
+
+
+def data_snapshot_date(con, latest_table=LATEST_TABLE):
+    """Dzień najnowszego pomiaru (YYYY-MM-DD) – klucz partycji wyników liczonych z tych danych; None bez pomiarów"""
+    day = con.execute(f"SELECT MAX(ts)::DATE FROM {latest_table}").fetchone()[0]
+    return None if day is None else day.isoformat()
+
+
+def update_latest_state(con, latest_table, batch_view):
+    """Upsert najnowszego pomiaru z paczki po kluczu station_id; starszy pomiar niż zapisany nie nadpisuje stanu"""
+    con.execute(f"""
+    INSERT INTO {latest_table}
+    SELECT DISTINCT ON (station_id) station_id, ts, available_bikes, free_places
+    FROM {batch_view}
+    ORDER BY station_id, ts DESC
+    ON CONFLICT (station_id) DO UPDATE SET
+        ts = EXCLUDED.ts,
+        bikes = EXCLUDED.bikes,
+        free_places = EXCLUDED.free_places
+    WHERE EXCLUDED.ts >= {latest_table}.ts
+    """)
+
+
+def merge_station_versions(con, dim_table, attributes_table, changes):
+    """Przelicza wersje (SCD typu 2) stacji, których atrybuty doszły lub zostały usunięte.
+
+    changes to relacja (station_id, ts) zmienionych obserwacji. Wersje stacji są liczone od nowa
+    z zapisanych obserwacji, począwszy od wersji trwającej tuż przed najwcześniejszą zmianą –
+    wcześniejsze wersje się nie zmieniają. Kolejne obserwacje o tych samych atrybutach są sklejane,
+    a valid_to to początek następnej wersji, więc wynik nie zależy od kolejności wczytywania plików.
+    """
+    con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE station_rebuild AS
+    SELECT c.station_id, MAX(d.valid_from) AS rebuild_from
+    FROM (SELECT station_id, MIN(ts) AS changed_from FROM {changes} GROUP BY station_id) c
+    LEFT JOIN {dim_table} d ON d.station_id = c.station_id AND d.valid_from < c.changed_from
+    GROUP BY c.station_id
+    """)
+    con.execute(f"""
+    DELETE FROM {dim_table} USING station_rebuild r
+    WHERE {dim_table}.station_id = r.station_id AND (r.rebuild_from IS NULL OR {dim_table}.valid_from >= r.rebuild_from)
+    """)
+    con.execute(f"""
+    INSERT INTO {dim_table}
+    WITH points AS (
+        SELECT DISTINCT ON (a.station_id, a.ts) a.station_id, a.name, a.lat, a.lon, a.ts AS valid_from
+        FROM {attributes_table} a
+        JOIN station_rebuild r ON a.station_id = r.station_id AND (r.rebuild_from IS NULL OR a.ts >= r.rebuild_from)
+        ORDER BY a.station_id, a.ts
+    ),
+    flagged AS (
+        SELECT
+            *,
+            LAG(valid_from) OVER w IS NOT NULL
+                AND LAG(name) OVER w IS NOT DISTINCT FROM name
+                AND LAG(lat) OVER w IS NOT DISTINCT FROM lat
+                AND LAG(lon) OVER w IS NOT DISTINCT FROM lon AS unchanged
+        FROM points
+        WINDOW w AS (PARTITION BY station_id ORDER BY valid_from)
+    )
+    SELECT
+        station_id,
+        name,
+        lat,
+        lon,
+        valid_from,
+        LEAD(valid_from) OVER (PARTITION BY station_id ORDER BY valid_from) AS valid_to
+    FROM flagged
+    WHERE NOT unchanged
+    ORDER BY station_id, valid_from
+    """)
+    con.execute("DROP TABLE station_rebuild")
+
+
+def append_snapshot_files(con, files, fact_table=FACT_TABLE, latest_table=LATEST_TABLE,
+                          attributes_table=ATTRIBUTES_TABLE, files_per_batch=FILES_PER_BATCH, workers=None):
+    """Dopisuje paczki plików JSON: fakty (station_id, ts, bikes, free_places) do tabeli faktów,
+    atrybuty stacji do tabeli atrybutów, najnowsze pomiary do stanu bieżącego.
+    Wymiar przelicza potem merge_station_versions. Zwraca (liczbę faktów, {ścieżka pliku: czas snapshotu})."""
+    total = 0
+    done = 0
+    snapshot_ts = {}
+    for batch in iter_snapshot_batches(files, files_per_batch, workers):
+        con.register("snapshot_batch", batch)
+        con.execute(f"""
+        INSERT INTO {fact_table}
+        SELECT station_id, ts, available_bikes, free_places FROM snapshot_batch
+        """)
+        con.execute(f"""
+        INSERT INTO {attributes_table}
+        SELECT station_id, ts, name, lat, lon FROM snapshot_batch
+        """)
+        update_latest_state(con, latest_table, "snapshot_batch")
+        con.unregister("snapshot_batch")
+        snapshot_ts.update(batch.groupby("snapshot")["ts"].first().to_dict())
+        total += len(batch)
+        done = min(done + files_per_batch, len(files))
+        print(f"[INFO] Wczytano pliki {done}/{len(files)} ({total} rekordów)")
+    return total, snapshot_ts
+
+
+def file_digest(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_key(path, folder):
+    """Klucz pliku w manifeście: ścieżka względem folderu snapshotów (pliki o tej samej nazwie
+    w różnych podkatalogach to różne wpisy)"""
+    return os.path.relpath(path, folder).replace(os.sep, "/")
+
+
+def pending_snapshot_files(con, table, files, folder):
+    """Zwraca [(path, size, mtime, hash)] plików nowych lub zmienionych względem manifestu"""
+    known = {
+        file_name: (size, mtime, file_hash)
+        for file_name, size, mtime, file_hash in con.execute(
+            f"SELECT file_name, size, mtime, hash FROM {MANIFEST_TABLE} WHERE target_table = ?", [table]
+        ).fetchall()
+    }
+
+    pending = []
+    for path in files:
+        stat = os.stat(path)
+        entry = known.get(manifest_key(path, folder))
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            continue
+        file_hash = file_digest(path)
+        if entry is not None and entry[2] == file_hash:
+            continue
+        pending.append((path, stat.st_size, stat.st_mtime, file_hash))
+    return pending
+
+
+def superseded_names(pending, files, folder):
+    """Wpisy manifestu z czasów kluczy bez podkatalogu (sama nazwa pliku), zastępowane przez
+    wczytywane pliki z podkatalogów – ich fakty trzeba usunąć razem z faktami tych plików"""
+    keys = {manifest_key(path, folder) for path in files}
+    names = {os.path.basename(path) for path, _, _, _ in pending if manifest_key(path, folder) != os.path.basename(path)}
+    return sorted(names - keys)
+
+
+def files_sharing_snapshot_ts(con, table, files, folder, pending_names):
+    """Niezmienione pliki z tym samym zapamiętanym czasem snapshotu co pliki zmienione –
+    fakty usuwane są po czasie, więc takie pliki trzeba wczytać ponownie"""
+    if not pending_names:
+        return []
+    shared = {
+        row[0] for row in con.execute(f"""
+        SELECT file_name FROM {MANIFEST_TABLE}
+        WHERE target_table = ? AND snapshot_ts IN (
+            SELECT snapshot_ts FROM {MANIFEST_TABLE} WHERE target_table = ? AND file_name IN (SELECT unnest(?))
+        )
+        """, [table, table, pending_names]).fetchall()
+    } - set(pending_names)
+    extra = []
+    for path in files:
+        if manifest_key(path, folder) in shared:
+            stat = os.stat(path)
+            extra.append((path, stat.st_size, stat.st_mtime, file_digest(path)))
+    return extra
+
+
+def load_new_snapshots_to_duckdb(con, folder, dim_table=DIM_TABLE, fact_table=FACT_TABLE, latest_table=LATEST_TABLE,
+                                 files_per_batch=FILES_PER_BATCH, workers=None, attributes_table=ATTRIBUTES_TABLE):
+    """Wczytuje do wymiaru stacji, tabeli faktów i stanu bieżącego tylko pliki JSON nowe
+    lub zmienione od ostatniego wczytania (manifest w DuckDB)
+
+    Fakty i atrybuty zmienionego pliku (po zapamiętanym czasie snapshotu) są najpierw usuwane, a pliki
+    z tym samym czasem wczytywane ponownie, więc każdy plik występuje w tabelach raz. Wymiar jest
+    przeliczany raz na wczytanie, tylko dla stacji z usuniętymi lub nowymi obserwacjami.
+    Zwraca liczbę dopisanych faktów.
+    """
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+        target_table VARCHAR,
+        file_name VARCHAR,
+        size BIGINT,
+        mtime DOUBLE,
+        hash VARCHAR,
+        loaded_at TIMESTAMP
+    )
+    """)
+    con.execute(f"ALTER TABLE {MANIFEST_TABLE} ADD COLUMN IF NOT EXISTS snapshot_ts TIMESTAMP")
+    first_load = con.execute(
+        f"SELECT COUNT(*) = 0 FROM {MANIFEST_TABLE} WHERE target_table = ?", [fact_table]
+    ).fetchone()[0]
+    create_station_tables(con, dim_table, fact_table, latest_table, replace=first_load, attributes_table=attributes_table)
+    if con.execute(f"SELECT COUNT(*) = 0 FROM {attributes_table}").fetchone()[0]:
+        # baza sprzed tabeli atrybutów – obserwacje odtwarzane raz z początków wersji wymiaru
+        con.execute(f"INSERT INTO {attributes_table} SELECT station_id, valid_from, name, lat, lon FROM {dim_table}")
+    if con.execute(f"SELECT COUNT(*) = 0 FROM {latest_table}").fetchone()[0]:
+        # baza sprzed tabeli stanu bieżącego – stan odtwarzany raz z faktów
+        update_latest_state(
+            con, latest_table, f"(SELECT station_id, ts, bikes AS available_bikes, free_places FROM {fact_table})"
+        )
+
+    files = list_snapshot_files(folder)
+    pending = pending_snapshot_files(con, fact_table, files, folder)
+    superseded = superseded_names(pending, files, folder)
+    pending_names = [manifest_key(path, folder) for path, _, _, _ in pending] + superseded
+    pending += files_sharing_snapshot_ts(con, fact_table, files, folder, pending_names)
+    print(f"[INFO] Pliki JSON: {len(files)}, nowe lub zmienione: {len(pending)}")
+    if not pending:
+        return 0
+
+    manifest = pd.DataFrame(
+        [(fact_table, manifest_key(path, folder), path, size, mtime, file_hash) for path, size, mtime, file_hash in pending],
+        columns=["target_table", "file_name", "path", "size", "mtime", "hash"],
+    )
+    replaced = pd.DataFrame({"file_name": manifest["file_name"].tolist() + superseded})
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.register("replaced_files", replaced)
+        con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE replaced_ts AS
+        SELECT DISTINCT snapshot_ts AS ts FROM {MANIFEST_TABLE}
+        WHERE target_table = ? AND file_name IN (SELECT file_name FROM replaced_files)
+        """, [fact_table])
+        # obserwacje usuwane razem z plikiem też zmieniają wersje stacji
+        con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE station_changes AS
+        SELECT station_id, ts FROM {attributes_table} WHERE ts IN (SELECT ts FROM replaced_ts)
+        """)
+        con.execute(f"DELETE FROM {fact_table} WHERE ts IN (SELECT ts FROM replaced_ts)")
+        con.execute(f"DELETE FROM {attributes_table} WHERE ts IN (SELECT ts FROM replaced_ts)")
+        total, snapshot_ts = append_snapshot_files(
+            con, [path for path, _, _, _ in pending], fact_table, latest_table, attributes_table, files_per_batch, workers
+        )
+        manifest["snapshot_ts"] = manifest["path"].map(snapshot_ts)
+        con.register("manifest_batch", manifest)
+        con.execute(f"""
+        INSERT INTO station_changes
+        SELECT station_id, ts FROM {attributes_table} WHERE ts IN (SELECT snapshot_ts FROM manifest_batch)
+        """)
+        merge_station_versions(con, dim_table, attributes_table, "station_changes")
+        con.execute("DROP TABLE station_changes")
+        con.execute("DROP TABLE replaced_ts")
+        con.execute(f"""
+        DELETE FROM {MANIFEST_TABLE}
+        WHERE target_table = ? AND file_name IN (SELECT file_name FROM replaced_files)
+        """, [fact_table])
+        con.unregister("replaced_files")
+        con.execute(f"""
+        INSERT INTO {MANIFEST_TABLE} (target_table, file_name, size, mtime, hash, loaded_at, snapshot_ts)
+        SELECT target_table, file_name, size, mtime, hash, now()::TIMESTAMP, snapshot_ts FROM manifest_batch
+        """)
+        con.unregister("manifest_batch")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return total
@@ -0,0 +1,104 @@
+import os
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import shapely
+
+CITY_CENTER = (52.2297, 21.0122)  # lat, lon – Warszawa
+CITY_RADIUS_M = 8000.0
+SNAPSHOT_INTERVAL_S = 600
+SNAPSHOT_START_TS = 1704067200  # 2024-01-01 00:00 UTC
+METERS_PER_DEG_LAT = 111320.0
+
+
+def offset_lonlat(dx, dy, center=CITY_CENTER):
+    """Przesunięcie o (dx, dy) metrów od środka miasta w przybliżeniu płaskim → (lon, lat)"""
+    lat0, lon0 = center
+    return lon0 + dx / (METERS_PER_DEG_LAT * math.cos(math.radians(lat0))), lat0 + dy / METERS_PER_DEG_LAT
+
+
+def random_disk(rng, n, radius=CITY_RADIUS_M):
+    r = radius * np.sqrt(rng.random(n))
+    angle = rng.uniform(0, 2 * np.pi, n)
+    return r * np.cos(angle), r * np.sin(angle)
+
+
+def generate_stations(n, rng, center=CITY_CENTER, radius=CITY_RADIUS_M):
+    """n stacji rozrzuconych równomiernie w kole wokół środka miasta"""
+    lon, lat = offset_lonlat(*random_disk(rng, n, radius), center)
+    return pd.DataFrame({
+        "station_id": np.arange(1, n + 1).astype(str),
+        "name": [f"Stacja {i}" for i in range(1, n + 1)],
+        "lat": lat,
+        "lon": lon,
+        "capacity": rng.integers(10, 41, n),
+    })
+
+
+def generate_paths(m, rng, center=CITY_CENTER, radius=CITY_RADIUS_M, min_vertices=3, max_vertices=30, step_m=(30.0, 120.0)):
+    """m ścieżek jako błądzenie losowe: kierunek skręca o N(0, 0.4 rad) na każdym kroku.
+    Zwraca (path_ids, LineStringi w EPSG:4326)."""
+    n_vertices = rng.integers(min_vertices, max_vertices + 1, m)
+    path_of_vertex = np.repeat(np.arange(m), n_vertices)
+    first = np.concatenate([[0], np.cumsum(n_vertices)[:-1]])
+
+    heading = rng.uniform(0, 2 * np.pi, m)[path_of_vertex] + rng.normal(0, 0.4, len(path_of_vertex))
+    step = rng.uniform(*step_m, len(path_of_vertex))
+    dx, dy = step * np.cos(heading), step * np.sin(heading)
+    # skumulowane przesunięcia liczone od początku każdej ścieżki (pierwszy wierzchołek = punkt startu)
+    dx[first], dy[first] = 0.0, 0.0
+    x, y = np.cumsum(dx), np.cumsum(dy)
+    x -= np.repeat(x[first], n_vertices)
+    y -= np.repeat(y[first], n_vertices)
+
+    start_x, start_y = random_disk(rng, m, radius)
+    lon, lat = offset_lonlat(x + start_x[path_of_vertex], y + start_y[path_of_vertex], center)
+    geoms = shapely.linestrings(np.column_stack([lon, lat]), indices=path_of_vertex)
+    return np.arange(1, m + 1), geoms
+
+
+def generate_city(n_stations, n_paths, seed=0):
+    """Deterministyczne miasto: (stacje, path_ids, geometrie) dla danego ziarna"""
+    rng = np.random.default_rng(seed)
+    stations = generate_stations(n_stations, rng)
+    path_ids, geoms = generate_paths(n_paths, rng)
+    return stations, path_ids, geoms
+
+
+def write_snapshots(stations, k, folder, seed=0, start_ts=SNAPSHOT_START_TS, interval_s=SNAPSHOT_INTERVAL_S):
+    """Zapisuje k plików snapshotów w formacie stations_data/geoCoords; liczba rowerów błądzi losowo.
+    Zwraca listę ścieżek plików."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    capacity = stations["capacity"].to_numpy()
+    bikes = rng.integers(0, capacity + 1)
+    paths = []
+    for i in range(k):
+        bikes = np.clip(bikes + rng.integers(-2, 3, len(bikes)), 0, capacity)
+        records = [
+            {
+                "uid": int(sid),
+                "number": sid,
+                "name": name,
+                "geoCoords": {"lat": float(lat), "lng": float(lon)},
+                "availabilityStatus": {"availableBikes": int(b), "freePlaces": int(c - b)},
+            }
+            for sid, name, lat, lon, b, c in zip(
+                stations["station_id"], stations["name"], stations["lat"], stations["lon"], bikes, capacity
+            )
+        ]
+        path = os.path.join(folder, f"snapshot_{i:05d}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": start_ts + i * interval_s, "stations_data": records}, f, ensure_ascii=False)
+        paths.append(path)
+    return paths
+
+
+def write_bike_paths_json(path_ids, geoms, path):
+    """Ścieżki w formacie bike_paths.json (tablica rekordów z geometrią WKT)"""
+    records = [{"id": int(i), "geometry": wkt} for i, wkt in zip(path_ids, shapely.to_wkt(geoms, rounding_precision=7))]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+    return path
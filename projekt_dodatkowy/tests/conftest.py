@@ -0,0 +1,5 @@
+import os
+import sys
+
+# moduły projektu leżą płasko w katalogu nadrzędnym
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
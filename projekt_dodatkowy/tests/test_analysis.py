@@ -0,0 +1,33 @@
+import numpy as np
+
+from analysis import SegmentIndex, haversine_np
+
+
+def random_segments(rng, n, center=(52.23, 21.01), spread=0.05):
+    start = np.column_stack([center[0] + rng.uniform(-spread, spread, n), center[1] + rng.uniform(-spread, spread, n)])
+    end = start + rng.uniform(-0.003, 0.003, (n, 2))
+    return np.column_stack([start, end])
+
+
+def brute_force(index, lat, lon):
+    return np.array([index.segment_distances(a, b, np.arange(len(index))).min() for a, b in zip(lat, lon)])
+
+
+def test_min_distances_match_brute_force():
+    rng = np.random.default_rng(0)
+    index = SegmentIndex(random_segments(rng, 500))
+    lat = 52.23 + rng.uniform(-0.08, 0.08, 200)
+    lon = 21.01 + rng.uniform(-0.08, 0.08, 200)
+
+    np.testing.assert_allclose(index.min_distances(lat, lon), brute_force(index, lat, lon), rtol=0, atol=1e-6)
+
+
+def test_min_distances_single_segment_is_endpoint_distance():
+    index = SegmentIndex([[52.0, 21.0, 52.0, 21.0]])
+    assert index.min_distances([52.01], [21.0])[0] == haversine_np(52.01, 21.0, 52.0, 21.0)
+
+
+def test_min_distances_without_stations():
+    index = SegmentIndex(random_segments(np.random.default_rng(1), 10))
+    result = index.min_distances(np.empty(0), np.empty(0))
+    assert result.shape == (0,)
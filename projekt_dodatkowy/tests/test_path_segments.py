@@ -0,0 +1,23 @@
+import numpy as np
+import shapely
+
+from path_segments import split_lines
+
+
+def test_pieces_keep_path_id_and_length_limit():
+    ids, pieces = split_lines([7], [shapely.from_wkt("LINESTRING (0 0, 500 0)")], max_length=200)
+    assert set(ids) == {7}
+    assert shapely.length(pieces).max() <= 200
+    assert np.isclose(shapely.length(pieces).sum(), 500)
+
+
+def test_closed_way_collapsed_by_simplify_is_dropped():
+    geoms = [shapely.from_wkt("LINESTRING (0 0, 3 0, 3 3, 0 0)"), shapely.from_wkt("LINESTRING (0 0, 100 0)")]
+    ids, pieces = split_lines([1, 2], geoms, tolerance=5)
+    assert ids.tolist() == [2]
+    assert np.isclose(shapely.length(pieces).sum(), 100)
+
+
+def test_zero_length_line_is_dropped():
+    ids, pieces = split_lines([1], [shapely.from_wkt("LINESTRING (1 1, 1 1)")])
+    assert len(ids) == len(pieces) == 0
@@ -0,0 +1,129 @@
+import textwrap
+
+import duckdb
+import pytest
+
+import pipeline
+from pipeline import Stage, run_pipeline
+
+# etapy-atrapy o tym samym układzie zasobów co STAGES: katalog "out" czytają i nadpisują kolejne etapy
+# (jak processed/analysis_output), a tabelę "clean" nadpisuje etap późniejszy od tych, które ją czytają
+STUB_MODULE = '''
+import os
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def load(con):
+    con.execute("CREATE OR REPLACE TABLE raw AS SELECT ? AS value", [read("source.txt")])
+
+
+def clean(con):
+    con.execute("CREATE OR REPLACE TABLE clean AS SELECT upper(value) AS value FROM raw")
+
+
+def segments(con):
+    con.execute("CREATE OR REPLACE TABLE segments AS SELECT value || '|seg' AS value FROM clean")
+
+
+def analysis(con):
+    write(os.path.join("out", "part.txt"), con.execute("SELECT value FROM segments").fetchone()[0])
+
+
+def update():
+    write(os.path.join("out", "part.txt"), read(os.path.join("out", "part.txt")).split("+")[0] + "+bikes")
+
+
+def osm(con):
+    con.execute("CREATE OR REPLACE TABLE clean AS SELECT upper(value) AS value FROM raw")
+    con.execute("CREATE OR REPLACE TABLE segments AS SELECT value || '|seg' AS value FROM clean")
+    write(os.path.join("out", "part.txt"), read(os.path.join("out", "part.txt")) + "+osm")
+
+
+def validate():
+    assert read(os.path.join("out", "part.txt")).endswith("+bikes+osm")
+'''
+
+
+def stub_stages():
+    module = "pipeline_stub_stages"
+    return [
+        Stage("load", module, "load", ["source.txt"], ["table:raw"], uses_con=True),
+        Stage("clean", module, "clean", ["table:raw"], ["table:clean"], uses_con=True),
+        Stage("segments", module, "segments", ["table:clean"], ["table:segments"], uses_con=True),
+        Stage("analysis", module, "analysis", ["table:clean", "table:segments"], ["out"], uses_con=True),
+        Stage("update", module, "update", ["out"], ["out"]),
+        Stage("osm", module, "osm", ["out"], ["table:clean", "table:segments", "out"], uses_con=True),
+        Stage("validate", module, "validate", ["out"]),
+    ]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    (tmp_path / "pipeline_stub_stages.py").write_text(textwrap.dedent(STUB_MODULE), encoding="utf-8")
+    (tmp_path / "source.txt").write_text("v1", encoding="utf-8")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    con = duckdb.connect(str(tmp_path / "pipeline.duckdb"))
+    yield con
+    con.close()
+
+
+def test_unchanged_tree_skips_every_stage(workdir):
+    stages = stub_stages()
+    first = run_pipeline(workdir, stages, workers=2)
+    assert set(first.values()) == {"done"}
+    # pomiary etapów trafiają do bazy pipeline'u, nie do bazy projektu
+    assert workdir.execute("SELECT COUNT(*) FROM pipeline_metrics WHERE kind = 'pipeline'").fetchone()[0] == len(stages)
+
+    for _ in range(3):
+        assert run_pipeline(workdir, stages, workers=2) == {s.name: "skipped" for s in stages}
+
+
+def test_changed_source_reruns_downstream(workdir, tmp_path):
+    stages = stub_stages()
+    run_pipeline(workdir, stages, workers=2)
+
+    (tmp_path / "source.txt").write_text("v2", encoding="utf-8")
+    assert set(run_pipeline(workdir, stages, workers=2).values()) == {"done"}
+    assert (tmp_path / "out" / "part.txt").read_text(encoding="utf-8") == "V2|seg+bikes+osm"
+    assert set(run_pipeline(workdir, stages, workers=2).values()) == {"skipped"}
+
+
+def test_selected_stages_share_fingerprints_with_full_plan(workdir):
+    stages = stub_stages()
+    run_pipeline(workdir, stages, workers=2)
+
+    selected = pipeline.select_stages(stages, ["validate"])
+    assert set(run_pipeline(workdir, selected, plan=stages).values()) == {"skipped"}
+
+
+def test_missing_output_reruns_stage(workdir):
+    stages = stub_stages()
+    run_pipeline(workdir, stages, workers=2)
+
+    workdir.execute("DROP TABLE segments")
+    status = run_pipeline(workdir, stages, workers=2)
+    assert status["segments"] == "done"
+    assert status["load"] == status["clean"] == "skipped"
+
+
+def test_appended_external_table_reruns_reader(workdir):
+    # tabela zasilana spoza pipeline'u (jak stations_raw) – odcisk z liczby wierszy i rowid, bez skanu
+    workdir.execute("CREATE TABLE feed AS SELECT 1 AS value")
+    workdir.execute("CREATE TABLE clean AS SELECT 'x' AS value")
+    stages = [Stage("reader", "pipeline_stub_stages", "segments", ["table:feed"], ["table:segments"], uses_con=True)]
+    assert run_pipeline(workdir, stages) == {"reader": "done"}
+    assert run_pipeline(workdir, stages) == {"reader": "skipped"}
+
+    workdir.execute("INSERT INTO feed VALUES (2)")
+    assert run_pipeline(workdir, stages) == {"reader": "done"}
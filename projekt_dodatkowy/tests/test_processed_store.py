@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from processed_store import list_snapshot_dates, read_analysis_output, write_analysis_output
+
+
+def stations(**extra):
+    return pd.DataFrame({"station_id": ["1", "2"], "lat": [52.2, 52.3], "lon": [21.0, 21.1], **extra})
+
+
+def test_roundtrip_adds_partition_and_geometry(tmp_path):
+    write_analysis_output(stations(min_distance_m=[1.5, 2.5]), snapshot_date="2024-01-01", dataset_path=tmp_path)
+
+    df = read_analysis_output(dataset_path=tmp_path)
+    assert df["min_distance_m"].tolist() == [1.5, 2.5]
+    assert df["snapshot_date"].unique().tolist() == ["2024-01-01"]
+    assert "geometry" in df.columns
+
+
+def test_column_added_in_newer_partition(tmp_path):
+    write_analysis_output(stations(), snapshot_date="2024-01-01", dataset_path=tmp_path)
+    write_analysis_output(stations(availableBikes=[3, 4]), snapshot_date="2024-01-02", dataset_path=tmp_path)
+    assert list_snapshot_dates(tmp_path) == ["2024-01-01", "2024-01-02"]
+
+    df = read_analysis_output(snapshot_date="2024-01-02", dataset_path=tmp_path)
+    assert df["availableBikes"].tolist() == [3, 4]
+
+    projected = read_analysis_output(columns=["station_id", "availableBikes"], dataset_path=tmp_path)
+    assert projected.columns.tolist() == ["station_id", "availableBikes"]
+
+    older = read_analysis_output(columns=["station_id", "availableBikes"], snapshot_date="2024-01-01", dataset_path=tmp_path)
+    assert older.columns.tolist() == ["station_id"]
+
+
+def test_missing_partition(tmp_path):
+    write_analysis_output(stations(), snapshot_date="2024-01-01", dataset_path=tmp_path)
+    with pytest.raises(FileNotFoundError):
+        read_analysis_output(snapshot_date="2024-02-01", dataset_path=tmp_path)
@@ -0,0 +1,28 @@
+import duckdb
+import numpy as np
+
+from station_cube import StationCube, build_cube
+
+
+def test_cells_of_stations_without_coordinates_are_skipped(tmp_path):
+    con = duckdb.connect()
+    con.execute("""
+    CREATE TABLE stations_snapshots AS SELECT * FROM (VALUES
+        (1, 52.2, 21.0), (2, NULL, NULL), (3, 52.3, 21.1)
+    ) t(station_id, latitude, longitude)
+    """)
+    con.execute("""
+    CREATE TABLE stations_hourly_summary AS SELECT * FROM (VALUES
+        (1, TIMESTAMPTZ '2024-01-01 00:00:00+00', 10, 2),
+        (2, TIMESTAMPTZ '2024-01-01 00:00:00+00', 90, 1),
+        (3, TIMESTAMPTZ '2024-01-01 01:00:00+00', 6, 1)
+    ) t(station_id, hour, sum_available_bikes, count_available_bikes)
+    """)
+
+    assert build_cube(con, cube_dir=tmp_path / "cube")
+    cube = StationCube(cube_dir=tmp_path / "cube")
+
+    assert cube.station_ids.tolist() == [1, 3]
+    assert cube.n_hours == 2
+    np.testing.assert_array_equal(cube.frame(0), [[52.2, 21.0, 5.0]])
+    np.testing.assert_array_equal(cube.frame(1), [[52.3, 21.1, 6.0]])
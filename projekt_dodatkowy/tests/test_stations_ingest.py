@@ -0,0 +1,57 @@
+import json
+import os
+
+import duckdb
+import pytest
+
+from stations_ingest import load_new_snapshots_to_duckdb
+
+
+def write_snapshot(folder, file_name, ts, name, lat=52.2):
+    path = folder / file_name
+    path.write_text(json.dumps({"timestamp": ts, "stations": [{"uid": 1, "name": name, "lat": lat, "lon": 21.0}]}))
+    # manifest porównuje rozmiar i mtime – zmieniony plik musi mieć inny mtime
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def versions(con):
+    return con.execute(
+        "SELECT name, valid_from::VARCHAR, valid_to::VARCHAR FROM stations_dim ORDER BY valid_from"
+    ).fetchall()
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    yield con
+    con.close()
+
+
+def test_late_snapshot_splits_version(con, tmp_path):
+    for file_name, ts in [("t1.json", "2024-01-01T01:00:00"), ("t3.json", "2024-01-01T03:00:00"),
+                          ("t5.json", "2024-01-01T05:00:00")]:
+        write_snapshot(tmp_path, file_name, ts, "A")
+    load_new_snapshots_to_duckdb(con, str(tmp_path), workers=1)
+    assert versions(con) == [("A", "2024-01-01 01:00:00", None)]
+
+    write_snapshot(tmp_path, "t2.json", "2024-01-01T02:00:00", "B")
+    load_new_snapshots_to_duckdb(con, str(tmp_path), workers=1)
+    assert versions(con) == [
+        ("A", "2024-01-01 01:00:00", "2024-01-01 02:00:00"),
+        ("B", "2024-01-01 02:00:00", "2024-01-01 03:00:00"),
+        ("A", "2024-01-01 03:00:00", None),
+    ]
+
+
+def test_changed_file_replaces_its_version(con, tmp_path):
+    write_snapshot(tmp_path, "t1.json", "2024-01-01T01:00:00", "A")
+    write_snapshot(tmp_path, "t2.json", "2024-01-01T02:00:00", "B")
+    load_new_snapshots_to_duckdb(con, str(tmp_path), workers=1)
+    assert [v[0] for v in versions(con)] == ["A", "B"]
+
+    # poprawiony plik z innym czasem snapshotu – wersja B nie może zostać w wymiarze
+    write_snapshot(tmp_path, "t2.json", "2024-01-01T02:30:00", "A")
+    load_new_snapshots_to_duckdb(con, str(tmp_path), workers=1)
+    assert versions(con) == [("A", "2024-01-01 01:00:00", None)]
+    assert con.execute("SELECT COUNT(*) FROM stations_fact").fetchone()[0] == 2
@@ -1,68 +1,49 @@
-import os
-import json
-import pandas as pd
+import duckdb
 
-CSV_FILE = "processed/analysis_output.csv"
-JSON_DIR = "stations/stations"
-MAX_FILES = 100
-
-csv_df = pd.read_csv(CSV_FILE)
-csv_df["station_id"] = csv_df["station_id"].astype(str)
-
-all_stations = []
-
-json_files = sorted(os.listdir(JSON_DIR))[:MAX_FILES]
-
-for idx, jf in enumerate(json_files, 1):
-    print(f"Wczytuję plik {idx}/{len(json_files)}: {jf}")
-    try:
-        with open(os.path.join(JSON_DIR, jf), "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except:
-        print(" - błąd JSON, pomijam")
-        continue
+from stations_ingest import DIM_TABLE, FACT_TABLE, LATEST_TABLE, load_new_snapshots_to_duckdb
+from pipeline_metrics import stage_metrics
+from processed_store import latest_snapshot_date, read_analysis_output, write_analysis_output
+from utils import DB_PATH
 
-    stations_list = (
-        data.get("stations_data")
-        or data.get("stations")
-        or data.get("station_data")
-        or None
-    )
-
-    if not stations_list:
-        print(" - brak listy stacji, pomijam")
-        continue
-
-    for s in stations_list:
-        station_id = (
-            s.get("uid") or
-            s.get("number") or
-            s.get("id") or
-            s.get("station_id")
+JSON_DIR = "stations/stations"
+DB_FILE = str(DB_PATH)
+TABLE_STATIONS = DIM_TABLE
+TABLE_AVAILABILITY = FACT_TABLE
+TABLE_LATEST = LATEST_TABLE
+
+
+def main():
+    snapshot_date = latest_snapshot_date()
+    analysis_df = read_analysis_output(snapshot_date=snapshot_date).drop(columns=["availableBikes"], errors="ignore")
+    analysis_df["station_id"] = analysis_df["station_id"].astype(str)
+
+    con = duckdb.connect(DB_FILE)
+    with stage_metrics("update_available_bikes", con) as m:
+        with m.step("load_snapshots"):
+            added = load_new_snapshots_to_duckdb(con, JSON_DIR, TABLE_STATIONS, TABLE_AVAILABILITY, TABLE_LATEST)
+        print(f"Dopisano {added} pomiarów do tabeli {TABLE_AVAILABILITY}")
+
+        # jeden wiersz na stację – rozmiar złączenia nie zależy od liczby snapshotów
+        df_stations = m.fetchdf(
+            f"SELECT station_id, bikes AS availableBikes FROM {TABLE_LATEST}", label="latest_availability"
         )
-        if station_id is None:
-            continue
+        m.rows_in = len(analysis_df)
 
-        available_bikes = (
-            s.get("availabilityStatus", {}).get("availableBikes")
-            or s.get("availableBikes")
-            or s.get("num_bikes_available")
-            or 0
-        )
+        if df_stations.empty:
+            print("Nie znaleziono żadnych danych o stacjach — żaden JSON nie miał właściwej struktury.")
+        else:
+            df_stations["station_id"] = df_stations["station_id"].astype(str)
 
-        all_stations.append({
-            "station_id": str(station_id),
-            "availableBikes": int(available_bikes)
-        })
+            df_merged = analysis_df.merge(df_stations, on="station_id", how="left", validate="many_to_one")
+            df_merged["availableBikes"] = df_merged["availableBikes"].fillna(0).astype(int)
+            m.rows_out = len(df_merged)
 
-if not all_stations:
-    print("Nie znaleziono żadnych danych o stacjach — żaden JSON nie miał właściwej struktury.")
-else:
-    df_stations = pd.DataFrame(all_stations)
-    df_stations["station_id"] = df_stations["station_id"].astype(str)
+            with m.step("write_analysis_output"):
+                write_analysis_output(df_merged, snapshot_date=snapshot_date)
+            print(f"️ Zaktualizowano {len(df_stations)} stacji")
+    con.close()
 
-    df_merged = csv_df.merge(df_stations, on="station_id", how="left")
-    df_merged["availableBikes"] = df_merged["availableBikes"].fillna(0).astype(int)
 
-    df_merged.to_csv(CSV_FILE, index=False)
-    print(f"️ Zaktualizowano {len(df_stations)} stacji")
+# main() pod ochroną __main__ – pula procesów (spawn na Windows) importuje ten moduł ponownie
+if __name__ == "__main__":
+    main()
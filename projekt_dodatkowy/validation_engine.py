@@ -0,0 +1,149 @@
+import os
+
+from processed_store import ANALYSIS_DATASET, PARTITION_COLUMN
+
+# oczekiwania zapisane jak w zestawach Great Expectations: {"expectation_type": ..., "kwargs": {...}}
+COLUMN_EXPECTATIONS = (
+    "expect_column_values_to_not_be_null",
+    "expect_column_values_to_be_between",
+    "expect_column_values_to_be_unique",
+)
+SUPPORTED_EXPECTATIONS = ("expect_column_to_exist", "expect_table_row_count_to_be_between") + COLUMN_EXPECTATIONS
+
+
+def expectation(expectation_type, **kwargs):
+    if expectation_type not in SUPPORTED_EXPECTATIONS:
+        raise ValueError(f"Nieobsługiwane oczekiwanie: {expectation_type}")
+    return {"expectation_type": expectation_type, "kwargs": kwargs}
+
+
+def parquet_source(dataset_path=ANALYSIS_DATASET, snapshot_date=None):
+    """Źródło dla validate_source: wszystkie partycje zbioru Parquet albo jedna partycja snapshot_date.
+
+    union_by_name łączy schematy plików – kolumna dodana w nowszej partycji nie ginie.
+    """
+    partition = f"{PARTITION_COLUMN}={snapshot_date}" if snapshot_date is not None else "*"
+    path = os.path.join(dataset_path, partition, "*.parquet").replace("'", "''")
+    return f"read_parquet('{path}', hive_partitioning = true, union_by_name = true)"
+
+
+def quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def sql_value(value):
+    return "NULL" if value is None else repr(float(value))
+
+
+def source_columns(con, source):
+    return {row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+
+
+def compile_expectation(i, exp):
+    """Agregaty SQL jednego oczekiwania jako [(alias, wyrażenie)] – wszystkie trafiają do jednego SELECT"""
+    kwargs = exp["kwargs"]
+    kind = exp["expectation_type"]
+    if kind not in COLUMN_EXPECTATIONS:
+        return []
+
+    col = quote(kwargs["column"])
+    aggregates = [(f"e{i}_nonnull", f"COUNT({col})")]
+    if kind == "expect_column_values_to_be_between":
+        low, high = kwargs.get("min_value"), kwargs.get("max_value")
+        conditions = []
+        if low is not None:
+            conditions.append(f"{col} {'<=' if kwargs.get('strict_min') else '<'} {sql_value(low)}")
+        if high is not None:
+            conditions.append(f"{col} {'>=' if kwargs.get('strict_max') else '>'} {sql_value(high)}")
+        unexpected = f"COUNT(*) FILTER (WHERE {' OR '.join(conditions)})" if conditions else "0"
+        aggregates.append((f"e{i}_unexpected", unexpected))
+    elif kind == "expect_column_values_to_be_unique":
+        # powtórzenia ponad pierwsze wystąpienie wartości
+        aggregates.append((f"e{i}_unexpected", f"COUNT({col}) - COUNT(DISTINCT {col})"))
+    return aggregates
+
+
+def column_result(exp, row_count, nonnull, unexpected):
+    """Wynik oczekiwania kolumnowego w układzie Great Expectations (z obsługą 'mostly')"""
+    missing = row_count - nonnull
+    if exp["expectation_type"] == "expect_column_values_to_not_be_null":
+        unexpected, base = missing, row_count
+        result = {"element_count": row_count, "unexpected_count": unexpected}
+    else:
+        base = nonnull
+        result = {
+            "element_count": row_count,
+            "missing_count": missing,
+            "missing_percent": 100.0 * missing / row_count if row_count else None,
+            "unexpected_count": unexpected,
+            "unexpected_percent_nonmissing": 100.0 * unexpected / nonnull if nonnull else None,
+        }
+    result["unexpected_percent"] = 100.0 * unexpected / base if base else None
+
+    mostly = exp["kwargs"].get("mostly", 1.0)
+    success = unexpected == 0 if mostly >= 1.0 else (base == 0 or (base - unexpected) / base >= mostly)
+    return success, result
+
+
+def validate_source(con, source, expectations, suite_name="default"):
+    """Sprawdza wszystkie oczekiwania jednym przebiegiem po całym źródle (tabela, widok lub read_parquet(...)).
+
+    Każde oczekiwanie jest kompilowane do agregatów DuckDB, do Pythona wraca jeden wiersz liczników.
+    Zwraca słownik w układzie ExpectationSuiteValidationResult.to_json_dict() z Great Expectations.
+    """
+    columns = source_columns(con, source)
+    aggregates = [("row_count", "COUNT(*)")]
+    for i, exp in enumerate(expectations):
+        if exp["expectation_type"] not in SUPPORTED_EXPECTATIONS:
+            raise ValueError(f"Nieobsługiwane oczekiwanie: {exp['expectation_type']}")
+        if exp["kwargs"].get("column", "") in columns or "column" not in exp["kwargs"]:
+            aggregates.extend(compile_expectation(i, exp))
+
+    select = ",\n        ".join(f"{sql} AS {alias}" for alias, sql in aggregates)
+    row = con.execute(f"SELECT\n        {select}\n    FROM {source}").fetchone()
+    values = dict(zip([alias for alias, _ in aggregates], row))
+    row_count = values["row_count"]
+
+    results = []
+    for i, exp in enumerate(expectations):
+        kind, kwargs = exp["expectation_type"], exp["kwargs"]
+        exception_info = {"raised_exception": False, "exception_message": None, "exception_traceback": None}
+        if kind == "expect_column_to_exist":
+            success, result = kwargs["column"] in columns, {}
+        elif kind == "expect_table_row_count_to_be_between":
+            low, high = kwargs.get("min_value"), kwargs.get("max_value")
+            success = (low is None or row_count >= low) and (high is None or row_count <= high)
+            result = {"observed_value": row_count}
+        elif kwargs["column"] not in columns:
+            success, result = False, {}
+            exception_info = {
+                "raised_exception": True,
+                "exception_message": f'Brak kolumny "{kwargs["column"]}" w {source}',
+                "exception_traceback": None,
+            }
+        else:
+            success, result = column_result(exp, row_count, values[f"e{i}_nonnull"], values.get(f"e{i}_unexpected"))
+        results.append({
+            "expectation_config": {"expectation_type": kind, "kwargs": kwargs, "meta": {}},
+            "success": success,
+            "result": result,
+            "exception_info": exception_info,
+            "meta": {},
+        })
+
+    successful = sum(r["success"] for r in results)
+    return {
+        "success": successful == len(results),
+        "results": results,
+        "statistics": {
+            "evaluated_expectations": len(results),
+            "successful_expectations": successful,
+            "unsuccessful_expectations": len(results) - successful,
+            "success_percent": 100.0 * successful / len(results) if results else None,
+        },
+        "meta": {"expectation_suite_name": suite_name, "active_batch_definition": {"source": source}},
+    }
+
+
+def failed_expectations(result):
+    return [r for r in result["results"] if not r["success"]]
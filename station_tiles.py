@@ -0,0 +1,178 @@
+import os
+import json
+import math
+import shutil
+import itertools
+
+import duckdb
+
+from utils import DB_PATH
+
+TILES_DIR = os.path.join("processed", "tiles")
+TILE_ZOOMS = range(8, 17)
+CELLS_PER_TILE = 8
+MAX_TILES_PER_VIEW = 64
+MAX_LAT = 85.0511
+
+
+def lonlat_to_tile(lon, lat, zoom):
+    """Współrzędne kafelka XYZ (Web Mercator) jako liczby zmiennoprzecinkowe"""
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    n = 2 ** zoom
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.log(math.tan(math.radians(lat)) + 1.0 / math.cos(math.radians(lat))) / math.pi) / 2.0 * n
+    return x, y
+
+
+def tile_range(south, west, north, east, zoom):
+    n = 2 ** zoom
+    x0, y0 = lonlat_to_tile(west, north, zoom)
+    x1, y1 = lonlat_to_tile(east, south, zoom)
+    clamp = lambda v: max(0, min(n - 1, int(math.floor(v))))
+    return range(clamp(x0), clamp(x1) + 1), range(clamp(y0), clamp(y1) + 1)
+
+
+def source_version(con):
+    """Znacznik wersji danych źródłowych – zmiana unieważnia cache kafelków"""
+    return str(con.execute("""
+    SELECT COUNT(*), MAX(hour), COALESCE(SUM(hash(station_id, hour, count_available_bikes)::HUGEINT), 0)
+    FROM stations_hourly_summary
+    """).fetchone())
+
+
+def read_manifest(tiles_dir=TILES_DIR):
+    path = os.path.join(tiles_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_tiles(con, tiles_dir=TILES_DIR, zooms=TILE_ZOOMS):
+    """Agreguje historię stacji do siatki CELLS_PER_TILE × CELLS_PER_TILE w każdym kafelku XYZ
+    dla podanych poziomów zoom i zapisuje kafelki jako GeoJSON na dysku.
+
+    Nic nie robi, jeśli cache odpowiada bieżącej wersji danych. Zwraca True, gdy kafelki przebudowano.
+    """
+    version = source_version(con)
+    if read_manifest(tiles_dir).get("version") == version:
+        return False
+
+    shutil.rmtree(tiles_dir, ignore_errors=True)
+    # stacje ze średnią i pozycją w Web Mercator dla zoom 0 liczone raz; każdy zoom to tylko skalowanie x, y
+    con.execute(f"""
+    CREATE OR REPLACE TEMP TABLE tile_stations AS
+    WITH stations AS (
+        SELECT
+            h.station_id,
+            s.lat,
+            s.lon,
+            SUM(h.sum_available_bikes) / NULLIF(SUM(h.count_available_bikes), 0) AS avg_bikes
+        FROM stations_hourly_summary h
+        JOIN (
+            SELECT station_id, ANY_VALUE(latitude) AS lat, ANY_VALUE(longitude) AS lon
+            FROM stations_snapshots
+            GROUP BY station_id
+        ) s USING (station_id)
+        GROUP BY h.station_id, s.lat, s.lon
+    )
+    SELECT
+        lat,
+        lon,
+        avg_bikes,
+        (lon + 180.0) / 360.0 AS x0,
+        (1.0 - ln(tan(radians(LEAST(GREATEST(lat, -{MAX_LAT}), {MAX_LAT})))
+            + 1.0 / cos(radians(LEAST(GREATEST(lat, -{MAX_LAT}), {MAX_LAT})))) / pi()) / 2.0 AS y0
+    FROM stations
+    WHERE lat IS NOT NULL AND lon IS NOT NULL
+    """)
+
+    for zoom in zooms:
+        rows = con.execute(f"""
+        WITH projected AS (
+            SELECT lat, lon, avg_bikes, x0 * pow(2, {zoom}) AS x, y0 * pow(2, {zoom}) AS y
+            FROM tile_stations
+        )
+        SELECT
+            floor(x)::INTEGER AS tile_x,
+            floor(y)::INTEGER AS tile_y,
+            COUNT(*) AS stations,
+            AVG(avg_bikes) AS avg_bikes,
+            AVG(lat) AS lat,
+            AVG(lon) AS lon
+        FROM projected
+        GROUP BY tile_x, tile_y, floor((x - floor(x)) * {CELLS_PER_TILE}), floor((y - floor(y)) * {CELLS_PER_TILE})
+        ORDER BY tile_x, tile_y
+        """).fetchall()
+
+        for (tile_x, tile_y), cells in itertools.groupby(rows, key=lambda r: (r[0], r[1])):
+            features = [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                    "properties": {
+                        "stations": stations,
+                        "avg_bikes": None if avg_bikes is None else round(avg_bikes, 2),
+                    },
+                }
+                for _, _, stations, avg_bikes, lat, lon in cells
+            ]
+            path = os.path.join(tiles_dir, str(zoom), str(tile_x), f"{tile_y}.json")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"type": "FeatureCollection", "features": features}, f)
+
+    con.execute("DROP TABLE tile_stations;")
+    with open(os.path.join(tiles_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": version, "zooms": list(zooms), "cells_per_tile": CELLS_PER_TILE}, f)
+    return True
+
+
+def read_view(south, west, north, east, zoom, tiles_dir=TILES_DIR):
+    """Zwraca FeatureCollection z kafelków widocznych w oknie mapy (tylko te pliki są czytane).
+
+    Zoom jest przycinany do zbudowanych poziomów i zmniejszany, dopóki okno obejmuje
+    więcej niż MAX_TILES_PER_VIEW kafelków, więc rozmiar odpowiedzi jest ograniczony.
+    """
+    zooms = read_manifest(tiles_dir).get("zooms") or list(TILE_ZOOMS)
+    zoom = max(min(zooms), min(max(zooms), int(zoom)))
+    xs, ys = tile_range(south, west, north, east, zoom)
+    while zoom > min(zooms) and len(xs) * len(ys) > MAX_TILES_PER_VIEW:
+        zoom -= 1
+        xs, ys = tile_range(south, west, north, east, zoom)
+
+    features = []
+    for x in xs:
+        for y in ys:
+            path = os.path.join(tiles_dir, str(zoom), str(x), f"{y}.json")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    features.extend(json.load(f)["features"])
+    return {"type": "FeatureCollection", "features": features}
+
+
+def view_bounds(state, center, zoom=12, pad_deg=0.1):
+    """(south, west, north, east, zoom) z wartości zwróconej przez st_folium;
+    przed pierwszą interakcją – okno wokół środka mapy"""
+    state = state or {}
+    bounds = state.get("bounds") or {}
+    south_west = bounds.get("_southWest") or {}
+    north_east = bounds.get("_northEast") or {}
+    zoom = state.get("zoom") or zoom
+    if south_west.get("lat") is None or north_east.get("lat") is None:
+        lat, lon = center
+        return lat - pad_deg, lon - pad_deg, lat + pad_deg, lon + pad_deg, zoom
+    return south_west["lat"], south_west["lng"], north_east["lat"], north_east["lng"], zoom
+
+
+def main():
+    con = duckdb.connect(str(DB_PATH), read_only=True)
+    if build_tiles(con):
+        print(f"[OK] Kafelki zapisane do: {TILES_DIR}")
+    else:
+        print("[INFO] Kafelki aktualne — pomijam budowanie.")
+    con.close()
+
+
+if __name__ == "__main__":
+    main()
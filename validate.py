@@ -1,79 +1,32 @@
-import duckdb
-import pandas as pd
-import great_expectations as gx
-from great_expectations.core.expectation_configuration import ExpectationConfiguration
-
-
-def main():
-
-    con = duckdb.connect("spatial_duck.db")
-    df = con.execute("SELECT * FROM bike_paths LIMIT 5000").df()
-
-    context = gx.get_context()
-
-  
-    try:
-        datasource = context.datasources["pandas_source"]
-    except KeyError:
-        datasource = context.sources.add_pandas("pandas_source")
-
-  
-    asset = datasource.add_dataframe_asset(
-        name="bike_paths_asset",
-        dataframe=df
-    )
-
-
-    batch_request = asset.build_batch_request()
+import json
 
+import duckdb
 
-    suite_name = "bike_paths_suite"
-
-    try:
-        suite = context.get_expectation_suite(expectation_suite_name=suite_name)
-    except:
-        suite = context.add_or_update_expectation_suite(expectation_suite_name=suite_name)
-
-
-    suite.expectations = []  
-
-    suite.expectations.append(
-        ExpectationConfiguration(
-            expectation_type="expect_column_to_exist",
-            kwargs={"column": "geometry"}
-        )
-    )
-
-    suite.expectations.append(
-        ExpectationConfiguration(
-            expectation_type="expect_column_values_to_not_be_null",
-            kwargs={"column": "geometry"}
-        )
-    )
-
-    suite.expectations.append(
-        ExpectationConfiguration(
-            expectation_type="expect_table_row_count_to_be_between",
-            kwargs={"min_value": 11}
-        )
-    )
-
+from pipeline_metrics import stage_metrics
+from utils import DB_PATH
+from validation_engine import expectation, validate_source
 
-    context.add_or_update_expectation_suite(expectation_suite=suite)
+TABLE_PATHS = "bike_paths"
+SUITE_NAME = "bike_paths_suite"
 
-    validator = context.get_validator(
-        batch_request=batch_request,
-        expectation_suite_name=suite_name
-    )
+EXPECTATIONS = [
+    expectation("expect_column_to_exist", column="geometry"),
+    expectation("expect_column_values_to_not_be_null", column="geometry"),
+    expectation("expect_table_row_count_to_be_between", min_value=11),
+]
 
 
-    results = validator.validate()
+def main():
+    # cała tabela jednym przebiegiem w DuckDB – do Pythona wracają tylko liczniki
+    con = duckdb.connect(str(DB_PATH))
+    with stage_metrics("validate", con) as m:
+        with m.step(SUITE_NAME):
+            results = validate_source(con, TABLE_PATHS, EXPECTATIONS, suite_name=SUITE_NAME)
+        m.rows_in = next(r["result"]["observed_value"] for r in results["results"] if "observed_value" in r["result"])
+    con.close()
 
     print("\n===== WYNIKI WALIDACJI =====\n")
-    print(results)
-
-    context.build_data_docs()
-    print("\nRaport: great_expectations/uncommitted/data_docs/local_site/index.html")
+    print(json.dumps(results, indent=2, ensure_ascii=False, default=str))
 
 
 if __name__ == "__main__":
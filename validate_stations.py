@@ -1,34 +1,46 @@
-
-import pandas as pd
-
-CSV_FILE = "processed/analysis_output.csv"
-
-def validate_stations(csv_path=CSV_FILE):
-    df = pd.read_csv(csv_path)
-
-    required_columns = ["station_id", "lat", "lon", "min_distance_m"]
-    for col in required_columns:
-        if col not in df.columns:
-            raise ValueError(f"Brak wymaganej kolumny: {col}")
-
- 
-    if df[required_columns].isnull().any().any():
-        raise ValueError("W danych znajdują się brakujące wartości!")
-
-
-    if not df["lat"].between(-90, 90).all():
-        raise ValueError("Są wartości lat poza zakresem -90 do 90")
-    if not df["lon"].between(-180, 180).all():
-        raise ValueError("Są wartości lon poza zakresem -180 do 180")
-    if (df["min_distance_m"] < 0).any():
-        raise ValueError("Są wartości min_distance_m mniejsze niż 0")
-
-
-    if len(df) == 0:
-        raise ValueError("Tabela stacji jest pusta!")
+import duckdb
+
+from validation_engine import expectation, parquet_source, validate_source
+from processed_store import latest_snapshot_date
+from pipeline_metrics import stage_metrics
+
+REQUIRED_COLUMNS = ["station_id", "lat", "lon", "min_distance_m"]
+
+# komunikat dla pierwszego niespełnionego oczekiwania – kolejność jak w dotychczasowych sprawdzeniach
+EXPECTATIONS = (
+    [(expectation("expect_column_to_exist", column=c), f"Brak wymaganej kolumny: {c}") for c in REQUIRED_COLUMNS]
+    + [(expectation("expect_column_values_to_not_be_null", column=c), "W danych znajdują się brakujące wartości!")
+       for c in REQUIRED_COLUMNS]
+    + [
+        (expectation("expect_column_values_to_be_between", column="lat", min_value=-90, max_value=90),
+         "Są wartości lat poza zakresem -90 do 90"),
+        (expectation("expect_column_values_to_be_between", column="lon", min_value=-180, max_value=180),
+         "Są wartości lon poza zakresem -180 do 180"),
+        (expectation("expect_column_values_to_be_between", column="min_distance_m", min_value=0),
+         "Są wartości min_distance_m mniejsze niż 0"),
+        (expectation("expect_table_row_count_to_be_between", min_value=1), "Tabela stacji jest pusta!"),
+    ]
+)
+
+
+def validate_stations(snapshot_date=None):
+    if snapshot_date is None:
+        snapshot_date = latest_snapshot_date()
+
+    con = duckdb.connect()
+    with stage_metrics("validate_stations", con) as m:
+        with m.step("stations_suite"):
+            results = validate_source(con, parquet_source(snapshot_date=snapshot_date), [e for e, _ in EXPECTATIONS],
+                                      suite_name="stations_suite")
+        m.rows_in = results["results"][-1]["result"].get("observed_value")
+    con.close()
+
+    for (_, message), result in zip(EXPECTATIONS, results["results"]):
+        if not result["success"]:
+            raise ValueError(message)
 
     print(" Walidacja danych stacji zakończona sukcesem")
-    print(f"Liczba stacji: {len(df)}")
+    print(f"Liczba stacji: {results['results'][-1]['result']['observed_value']}")
 
 if __name__ == "__main__":
     validate_stations()